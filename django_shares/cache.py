@@ -0,0 +1,411 @@
+"""
+Caching of shares for shared objects.
+
+There are two levels of caching:
+
+* request cache: shares cached for the life of a request.  Activated by
+    ``django_shares.middleware.ShareCacheMiddleware``.
+* shared cache: shares cached across requests with django's cache framework.
+    Enabled by setting ``SHARES_CACHE_ALIAS`` to the alias of the cache to use.
+    ``SHARES_CACHE_TIMEOUT`` sets the number of seconds shares are cached
+    (defaults to 300).  ``SHARES_TOKEN_CACHE_TIMEOUT`` sets the number of
+    seconds shares looked up by token are cached (defaults to 60).
+"""
+from __future__ import unicode_literals
+
+import copy
+import threading
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from .compat import get_cache
+from .utils import ShareList
+
+
+_local = threading.local()
+_share_cache = None
+
+# Attribute on a cached share with the names of the user fields that were
+# loaded with the share before they were removed for caching.
+CACHED_USER_FIELDS_ATTR = '_cached_user_fields'
+
+
+class RequestShareCache(object):
+    """Cache of shares for shared objects that lives for a single request.
+
+    Shares are cached by the shared object key which is a tuple of
+    (content_type_id, object_id).  The ``hits`` and ``misses`` attributes
+    count how many times shares were read from the cache vs loaded from the
+    database.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._shares_by_key = {}
+
+    def get_shares(self, key, loader):
+        """Gets the shares for a shared object.
+
+        :param key: tuple of (content_type_id, object_id) for the shared
+            object.
+        :param loader: callable that returns an iterable of shares for the
+            shared object when the shares are not cached yet.
+        :return: ShareList of the shares for the shared object.
+        """
+        shares = self._shares_by_key.get(key)
+
+        if shares is not None:
+            self.hits += 1
+            return shares
+
+        self.misses += 1
+        shares = ShareList(loader())
+        self._shares_by_key[key] = shares
+        return shares
+
+    def invalidate(self, key=None):
+        """Removes the cached shares for a shared object.
+
+        :param key: tuple of (content_type_id, object_id) for the shared
+            object.  If None, all cached shares are removed.
+        """
+        if key is None:
+            self._shares_by_key.clear()
+        else:
+            self._shares_by_key.pop(key, None)
+
+    def get_stats(self):
+        """Gets a dict of the cache hits, misses and cached object count."""
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'objects': len(self._shares_by_key)}
+
+
+class SharedObjectShareCache(object):
+    """Cache of shares for shared objects that's shared across requests.  The
+    shares for a shared object and each user's share to the shared object are
+    cached by the shared object key which is a tuple of
+    (content_type_id, object_id).
+
+    Cache keys are versioned so invalidating a shared object only bumps the
+    object's version and invalidating everything only bumps the global
+    version.  Both are O(1) no matter how many keys are cached.
+
+    Shares are cached without the users they've been loaded with so user rows
+    (i.e. password hashes) are never stored in the cache.  The users of
+    shares read from the cache are loaded again with a single query.
+    """
+    key_prefix = 'django_shares:shares'
+
+    def __init__(self, alias, timeout=300, token_timeout=60):
+        self.cache = get_cache(alias)
+        self.timeout = timeout
+        self.token_timeout = token_timeout
+
+    def get_shares(self, key, loader):
+        """Gets the shares for a shared object.
+
+        :param key: tuple of (content_type_id, object_id) for the shared
+            object.
+        :param loader: callable that returns an iterable of shares for the
+            shared object when the shares are not cached.
+        :return: list of the shares for the shared object.
+        """
+        cache_key = self._get_cache_key(key, 'all')
+        shares = self.cache.get(cache_key)
+
+        if shares is None:
+            shares = list(loader())
+            self.cache.set(cache_key,
+                           [get_cacheable_share(share) for share in shares],
+                           self.timeout)
+            return shares
+
+        load_cached_share_users(shares)
+        return shares
+
+    def get_user_share(self, key, user_id, loader):
+        """Gets the share to a shared object for a user.
+
+        :param key: tuple of (content_type_id, object_id) for the shared
+            object.
+        :param user_id: id of the user the share is for.
+        :param loader: callable that returns the user's share or None when the
+            share is not cached.
+        :return: the user's share or None if the user doesn't have a share.
+        """
+        cache_key = self._get_cache_key(key, 'user:{0}'.format(user_id))
+        # The share is wrapped in a tuple so a user without a share can be
+        # told apart from a cache miss.
+        cached = self.cache.get(cache_key)
+
+        if cached is None:
+            share = loader()
+            self.cache.set(cache_key, (get_cacheable_share(share),),
+                           self.timeout)
+            return share
+
+        load_cached_share_users(cached)
+        return cached[0]
+
+    def get_token_share(self, token, loader):
+        """Gets a share by its token.
+
+        The token maps to the shared object key of the share and the share
+        is cached under the shared object's version so the share is
+        invalidated along with the rest of the shared object's shares.  Tokens
+        without a share aren't cached.
+
+        :param token: the share token.
+        :param loader: callable that returns the share for the token or None
+            when the share is not cached.
+        :return: the share or None if there isn't a share with the token.
+        """
+        token_key = '{0}:token:{1}'.format(self.key_prefix, token)
+        name = 'token:{0}'.format(token)
+        key = self.cache.get(token_key)
+
+        if key is not None:
+            cached = self.cache.get(self._get_cache_key(key, name))
+
+            if cached is not None:
+                load_cached_share_users(cached)
+                return cached[0]
+
+        share = loader()
+
+        if share is None:
+            return None
+
+        key = (share.content_type_id, share.object_id)
+        self.cache.set_many({token_key: key,
+                             self._get_cache_key(key, name): (
+                                 get_cacheable_share(share),
+                             )},
+                            self.token_timeout)
+        return share
+
+    def get_user_value(self, user_id, name, loader):
+        """Gets a cached value computed from all of a user's shares (i.e. the
+        ids of the objects shared with the user).
+
+        :param user_id: id of the user.
+        :param name: name of the value.
+        :param loader: callable that returns the value when it's not cached.
+        """
+        version_keys = [self._get_version_key(),
+                        self._get_user_version_key(),
+                        self._get_user_version_key(user_id)]
+        versions = self.cache.get_many(version_keys)
+        cache_key = '{0}:{1}:{2}:user:{3}:{4}:{5}'.format(
+            self.key_prefix,
+            versions.get(version_keys[0], 0),
+            versions.get(version_keys[1], 0),
+            user_id,
+            versions.get(version_keys[2], 0),
+            name
+        )
+        value = self.cache.get(cache_key)
+
+        if value is None:
+            value = loader()
+            self.cache.set(cache_key, value, self.timeout)
+
+        return value
+
+    def invalidate(self, key=None):
+        """Invalidates the cached shares for a shared object.
+
+        :param key: tuple of (content_type_id, object_id) for the shared
+            object.  If None, all cached shares are invalidated.
+        """
+        self._incr_version(self._get_version_key(key))
+
+    def invalidate_user(self, user_id=None):
+        """Invalidates the cached values computed from a user's shares.
+
+        :param user_id: id of the user.  If None, the cached values for all
+            users are invalidated.
+        """
+        self._incr_version(self._get_user_version_key(user_id))
+
+    def _get_cache_key(self, key, name):
+        version_keys = [self._get_version_key(), self._get_version_key(key)]
+        versions = self.cache.get_many(version_keys)
+        return '{0}:{1}:{2}:{3}:{4}:{5}'.format(
+            self.key_prefix,
+            versions.get(version_keys[0], 0),
+            key[0],
+            key[1],
+            versions.get(version_keys[1], 0),
+            name
+        )
+
+    def _get_version_key(self, key=None):
+        if key is None:
+            return '{0}:version'.format(self.key_prefix)
+
+        return '{0}:version:{1}:{2}'.format(self.key_prefix, key[0], key[1])
+
+    def _get_user_version_key(self, user_id=None):
+        if user_id is None:
+            return '{0}:version:users'.format(self.key_prefix)
+
+        return '{0}:version:user:{1}'.format(self.key_prefix, user_id)
+
+    def _incr_version(self, version_key):
+        self.cache.add(version_key, 0, None)
+
+        try:
+            self.cache.incr(version_key)
+        except ValueError:
+            # Evicted between the add and incr.
+            self.cache.set(version_key, 1, None)
+
+
+def get_cacheable_share(share):
+    """Gets a copy of the share without the users that were loaded with it so
+    it can be stored in a cache that's shared across requests.  The names of
+    the removed user fields are kept so ``load_cached_share_users`` can load
+    the users again.
+
+    :param share: the share or None.
+    """
+    if share is None:
+        return None
+
+    user_model = get_user_model()
+    cacheable = copy.copy(share)
+    user_field_names = []
+
+    for field in share._meta.fields:
+        if (field.rel is not None and field.rel.to is user_model and
+                field.get_cache_name() in cacheable.__dict__):
+            del cacheable.__dict__[field.get_cache_name()]
+            user_field_names.append(field.name)
+
+    setattr(cacheable, CACHED_USER_FIELDS_ATTR, user_field_names)
+    return cacheable
+
+
+def load_cached_share_users(shares):
+    """Loads the users removed by ``get_cacheable_share`` from shares read from
+    the cache with a single query for all the shares.
+
+    :param shares: iterable of shares read from the cache.  None values are
+        ignored.
+    """
+    fields_by_share = []
+
+    for share in shares:
+        if share is None or CACHED_USER_FIELDS_ATTR not in share.__dict__:
+            continue
+
+        field_names = share.__dict__.pop(CACHED_USER_FIELDS_ATTR)
+        fields_by_share.append((share, [share._meta.get_field(field_name)
+                                        for field_name in field_names]))
+
+    user_ids = set(getattr(share, field.attname)
+                   for share, fields in fields_by_share
+                   for field in fields)
+    user_ids.discard(None)
+
+    if not user_ids:
+        users = {}
+    else:
+        users = get_user_model()._default_manager.in_bulk(list(user_ids))
+
+    for share, fields in fields_by_share:
+        for field in fields:
+            user_id = getattr(share, field.attname)
+
+            if user_id is None or user_id in users:
+                setattr(share, field.get_cache_name(), users.get(user_id))
+
+
+def get_share_cache():
+    """Gets the cache of shares shared across requests or None if the
+    ``SHARES_CACHE_ALIAS`` setting isn't set.
+    """
+    global _share_cache
+
+    alias = getattr(settings, 'SHARES_CACHE_ALIAS', None)
+
+    if not alias:
+        return None
+
+    timeout = getattr(settings, 'SHARES_CACHE_TIMEOUT', 300)
+    token_timeout = getattr(settings, 'SHARES_TOKEN_CACHE_TIMEOUT', 60)
+
+    if (_share_cache is None or _share_cache.alias != alias or
+        _share_cache.timeout != timeout or
+        _share_cache.token_timeout != token_timeout):
+        _share_cache = SharedObjectShareCache(alias=alias,
+                                              timeout=timeout,
+                                              token_timeout=token_timeout)
+        _share_cache.alias = alias
+
+    return _share_cache
+
+
+def activate_request_cache():
+    """Activates a new share cache for the current thread and returns it."""
+    _local.request_cache = RequestShareCache()
+    return _local.request_cache
+
+
+def deactivate_request_cache():
+    """Deactivates the share cache for the current thread."""
+    _local.request_cache = None
+
+
+def get_request_cache():
+    """Gets the share cache active for the current thread or None if no
+    cache is active.
+    """
+    return getattr(_local, 'request_cache', None)
+
+
+def invalidate_shares(keys=None):
+    """Invalidates cached shares for shared objects in both the request cache
+    and the shared cache.
+
+    :param keys: iterable of (content_type_id, object_id) tuples.  If None,
+        all cached shares are invalidated.
+    """
+    caches = [cache for cache in (get_request_cache(), get_share_cache())
+              if cache is not None]
+
+    if not caches:
+        return
+
+    if keys is None:
+        for cache in caches:
+            cache.invalidate()
+        return
+
+    for key in keys:
+        for cache in caches:
+            cache.invalidate(key)
+
+
+def invalidate_user_shares(user_ids=None):
+    """Invalidates the values cached from all of a user's shares in the shared
+    cache.
+
+    :param user_ids: iterable of user ids.  If None, the cached values for all
+        users are invalidated.
+    """
+    share_cache = get_share_cache()
+
+    if share_cache is None:
+        return
+
+    if user_ids is None:
+        share_cache.invalidate_user()
+        return
+
+    for user_id in user_ids:
+        share_cache.invalidate_user(user_id)
@@ -0,0 +1,34 @@
+"""
+Compatibility between the supported django versions.
+"""
+from __future__ import unicode_literals
+
+try:
+    from django.apps import apps
+except ImportError:  # django < 1.7
+    from django.db.models import get_model as _get_model
+    from django.db.models import get_models
+
+    def get_model(app_label, model_name):
+        return _get_model(app_label, model_name)
+else:
+    get_model = apps.get_model
+    get_models = apps.get_models
+
+try:
+    from django.core.cache import caches
+except ImportError:  # django < 1.7
+    from django.core.cache import get_cache
+else:
+    def get_cache(alias):
+        return caches[alias]
+
+try:
+    from django.utils.module_loading import import_string
+except ImportError:  # django < 1.7
+    from django.utils.module_loading import import_by_path as import_string
+
+try:
+    from django.db.models.signals import post_migrate
+except ImportError:  # django < 1.7
+    from django.db.models.signals import post_syncdb as post_migrate
@@ -27,3 +27,22 @@ class Status(object):
         (ACCEPTED, DECLINED, DELETED, PENDING, INACTIVE)
         """
         return (choice[0] for choice in cls.CHOICES)
+
+
+class SharedObjectsQueryStrategy(object):
+    """Strategies for querying shares for many shared objects.
+
+    OR: single query ORing a (content_type, object_id IN (...)) clause for
+        each content type.
+    PER_CONTENT_TYPE: one query per content type per chunk of object ids.
+    VALUES: one query per chunk joining on a VALUES list of
+        (content_type_id, object_id) pairs.  Only used on backends that
+        support row value comparisons (postgresql), otherwise falls back to
+        PER_CONTENT_TYPE.
+    """
+    OR = 'OR'
+    PER_CONTENT_TYPE = 'PER_CONTENT_TYPE'
+    VALUES = 'VALUES'
+    CHOICES = ((OR, 'Or'),
+               (PER_CONTENT_TYPE, 'Per content type'),
+               (VALUES, 'Values'))
@@ -0,0 +1,332 @@
+"""
+Denormalized counts of shares by status for each shared object.
+
+Counting is disabled by default.  To enable it, set ``SHARES_COUNTER_BACKEND``
+to one of the counter classes in this module:
+
+* ``django_shares.counters.CacheShareCounter``: keeps the counts in the cache
+    set by ``SHARES_COUNTER_CACHE_ALIAS`` (defaults to "default").  Counts that
+    aren't in the cache are recomputed from the database when read.  Counts
+    are updated once the shares are committed.
+* ``django_shares.counters.ModelShareCounter``: keeps the counts in the
+    concrete model set by ``SHARES_COUNTER_MODEL`` ("app_label.ModelName")
+    which must extend ``django_shares.models.AbstractShareCount``.  Counts are
+    updated in the same transaction as the shares.
+
+Counts can be rebuilt from scratch with the ``rebuild_share_counts``
+management command.
+"""
+from __future__ import unicode_literals
+
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db import transaction
+from django.db.models import F
+
+from .compat import get_cache
+from .compat import get_model
+from .compat import import_string
+from .constants import Status
+
+
+_counter = None
+
+
+class BaseShareCounter(object):
+    """Base class for share counters.  Shared objects are identified by a key
+    which is a tuple of (content_type_id, object_id).
+
+    ``transactional`` is True if the counts are stored in the database with
+    the shares and are rolled back with them.
+    """
+    transactional = True
+
+    def get_counts(self, key, loader=None):
+        """Gets the share counts for a shared object.
+
+        :param key: tuple of (content_type_id, object_id).
+        :param loader: callable that computes the counts from the database
+            when the counts for the object aren't known.  The computed counts
+            are stored in the counter.
+        :return: dict of share counts keyed by status or None if the counts
+            for the object aren't known and no loader is given.
+        """
+        raise NotImplementedError
+
+    def set_counts(self, key, counts):
+        """Sets the share counts for a shared object.
+
+        :param key: tuple of (content_type_id, object_id).
+        :param counts: dict of share counts keyed by status.
+        """
+        raise NotImplementedError
+
+    def incr(self, key, status, delta):
+        """Increments the count of shares with a status for a shared object.
+        ``delta`` can be negative.
+        """
+        raise NotImplementedError
+
+    def delete_counts(self, key):
+        """Removes the share counts for a shared object so they're recomputed
+        from the database when read.
+
+        :param key: tuple of (content_type_id, object_id).
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        """Removes all the counts."""
+        raise NotImplementedError
+
+    def apply_changes(self, changes):
+        """Applies share changes to the counts.
+
+        :param changes: iterable of (key, old_status, new_status, num_shares)
+            tuples.  ``old_status`` is None for newly created shares.
+        """
+        for (key, status), delta in get_count_deltas(changes).items():
+            if delta:
+                self.incr(key=key, status=status, delta=delta)
+
+
+class CacheShareCounter(BaseShareCounter):
+    """Share counter backed by django's cache framework.
+
+    Each shared object's counts are cached under a version for the object.
+    An increment for counts that aren't cached bumps the version so counts
+    that are being recomputed at the same time (and may have missed the
+    change) are stored under the old version and never read.
+    """
+
+    key_prefix = 'django_shares:count'
+    transactional = False
+
+    def __init__(self):
+        self.cache = get_cache(getattr(settings, 'SHARES_COUNTER_CACHE_ALIAS',
+                                       'default'))
+        self.timeout = getattr(settings, 'SHARES_COUNTER_CACHE_TIMEOUT', None)
+
+    def get_counts(self, key, loader=None):
+        versions = self._get_versions(key)
+        cache_keys = self._get_cache_keys(key, versions)
+        counts = self.cache.get_many(cache_keys.keys())
+
+        if len(counts) == len(cache_keys):
+            return dict((cache_keys[cache_key], count)
+                        for cache_key, count in counts.items())
+
+        if loader is None:
+            return None
+
+        # The versions were read before the counts are computed so the
+        # counts are stored under a stale version if they changed meanwhile.
+        counts = loader()
+        self._set_counts(key, counts, versions)
+        return counts
+
+    def set_counts(self, key, counts):
+        self._set_counts(key, counts, self._get_versions(key))
+
+    def incr(self, key, status, delta):
+        cache_key = self._get_cache_key(key, status, self._get_versions(key))
+
+        try:
+            self.cache.incr(cache_key, delta)
+        except ValueError:
+            # The count isn't cached so it will be recomputed when read.  A
+            # recompute that's already running may have missed this change.
+            self.delete_counts(key)
+
+    def delete_counts(self, key):
+        self._incr_version(self._get_version_key(key))
+
+    def clear(self):
+        # Bumping the version makes all the existing keys unreachable.
+        self._incr_version(self._get_version_key())
+
+    def _set_counts(self, key, counts, versions):
+        self.cache.set_many(dict((cache_key, counts.get(status, 0))
+                                 for cache_key, status
+                                 in self._get_cache_keys(key,
+                                                         versions).items()),
+                            self.timeout)
+
+    def _get_cache_keys(self, key, versions):
+        """Gets a dict of the statuses keyed by the cache key for the status
+        count.
+        """
+        return dict((self._get_cache_key(key, status, versions), status)
+                    for status in Status.get_keys())
+
+    def _get_cache_key(self, key, status, versions):
+        return '{0}:{1}:{2}:{3}:{4}:{5}'.format(self.key_prefix, versions[0],
+                                                key[0], key[1], versions[1],
+                                                status)
+
+    def _get_versions(self, key):
+        """Gets a tuple of the (global version, shared object version)."""
+        version_keys = [self._get_version_key(), self._get_version_key(key)]
+        versions = self.cache.get_many(version_keys)
+        return (versions.get(version_keys[0], 0),
+                versions.get(version_keys[1], 0))
+
+    def _get_version_key(self, key=None):
+        if key is None:
+            return '{0}:version'.format(self.key_prefix)
+
+        return '{0}:version:{1}:{2}'.format(self.key_prefix, key[0], key[1])
+
+    def _incr_version(self, version_key):
+        self.cache.add(version_key, 0, None)
+
+        try:
+            self.cache.incr(version_key)
+        except ValueError:
+            # Evicted between the add and incr.
+            self.cache.set(version_key, 1, None)
+
+
+class ModelShareCounter(BaseShareCounter):
+    """Share counter backed by a concrete model that extends
+    ``django_shares.models.AbstractShareCount``.
+    """
+
+    def __init__(self):
+        self.model = get_model(*settings.SHARES_COUNTER_MODEL.split('.'))
+
+    def get_counts(self, key, loader=None):
+        counts = dict((status, 0) for status in Status.get_keys())
+        counts.update(self._filter(key).values_list('status', 'count'))
+        return counts
+
+    def set_counts(self, key, counts):
+        for status in Status.get_keys():
+            self._set_count(key, status, counts.get(status, 0))
+
+    def incr(self, key, status, delta):
+        queryset = self._filter(key, status=status)
+
+        if delta < 0:
+            queryset = queryset.filter(count__gte=-delta)
+
+        if not queryset.update(count=F('count') + delta):
+            # The count is missing or would go below 0 because it's out of
+            # sync with the shares so it's clamped to 0.
+            self._set_count(key, status, max(delta, 0))
+
+    def delete_counts(self, key):
+        self._filter(key).delete()
+
+    def clear(self):
+        self.model.objects.all().delete()
+
+    def _filter(self, key, **kwargs):
+        return self.model.objects.filter(content_type_id=key[0],
+                                         object_id=key[1],
+                                         **kwargs)
+
+    def _set_count(self, key, status, count):
+        if self._filter(key, status=status).update(count=count):
+            return
+
+        try:
+            with transaction.atomic():
+                self.model.objects.create(content_type_id=key[0],
+                                          object_id=key[1],
+                                          status=status,
+                                          count=count)
+        except IntegrityError:
+            # Created by another process in the meantime
+            self._filter(key, status=status).update(count=count)
+
+
+def get_share_counter():
+    """Gets the share counter set by ``SHARES_COUNTER_BACKEND`` or None if
+    share counting isn't enabled.
+    """
+    global _counter
+
+    backend = getattr(settings, 'SHARES_COUNTER_BACKEND', None)
+
+    if not backend:
+        return None
+
+    if _counter is None or _counter.backend != backend:
+        _counter = import_string(backend)()
+        _counter.backend = backend
+
+    return _counter
+
+
+def get_count_deltas(changes):
+    """Gets the change in counts from share changes.
+
+    :param changes: iterable of (key, old_status, new_status, num_shares)
+        tuples.
+    :return: dict of count deltas keyed by (key, status).
+    """
+    deltas = {}
+
+    for key, old_status, new_status, num_shares in changes:
+        if old_status == new_status:
+            continue
+
+        if old_status is not None:
+            deltas[(key, old_status)] = (deltas.get((key, old_status), 0) -
+                                         num_shares)
+
+        if new_status is not None:
+            deltas[(key, new_status)] = (deltas.get((key, new_status), 0) +
+                                         num_shares)
+
+    return deltas
+
+
+@contextmanager
+def record_share_changes(using=None):
+    """Context manager for recording share changes in the share counter.
+    Yields a list to add (key, old_status, new_status, num_shares) tuples to
+    or None if share counting isn't enabled.  When enabled, the block runs in
+    a transaction.  The changes are applied to a transactional counter before
+    the transaction commits and to other counters after it commits.
+
+    >> with record_share_changes() as changes:
+    ..     share.save()
+    ..     if changes is not None:
+    ..         changes.append((key, None, share.status, 1))
+    """
+    counter = get_share_counter()
+
+    if counter is None:
+        yield None
+        return
+
+    changes = []
+
+    with transaction.atomic(using=using):
+        yield changes
+
+        if counter.transactional:
+            counter.apply_changes(changes)
+
+    if not counter.transactional and changes:
+        _apply_changes_on_commit(counter, changes, using=using)
+
+
+def _apply_changes_on_commit(counter, changes, using=None):
+    """Applies share changes to a counter once the current transaction
+    commits so the counts aren't changed by shares that are rolled back.
+    """
+    if hasattr(transaction, 'on_commit'):
+        transaction.on_commit(lambda: counter.apply_changes(changes),
+                              using=using)
+    elif not transaction.get_connection(using).in_atomic_block:
+        counter.apply_changes(changes)
+    else:
+        # django < 1.9 has no commit hook for the outer transaction so the
+        # counts are removed and recomputed from the database when read.
+        for key in set(change[0] for change in changes):
+            counter.delete_counts(key)
@@ -3,3 +3,5 @@ from .managers import SharedObjectManager
 from .mixins import AbstractSafeDeleteSharedObjectModelMixin
 from .mixins import AbstractSharedObjectModelMixin
 from .mixins import SafeDeleteShareModelMixin
+from .querysets import ShareQuerySet
+from .querysets import SharedObjectQuerySet
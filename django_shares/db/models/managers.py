@@ -1,12 +1,43 @@
 from __future__ import unicode_literals
 
-from django.contrib.contenttypes.models import ContentType
+from array import array
+from itertools import chain
+
+from django.db import IntegrityError
+from django.db import connections
+from django.db import transaction
+from django.db.models import Count
 from django.db.models.query_utils import Q
+from django.db.models.sql.where import AND
+from django.utils.six import string_types
 from django_core.db.models import BaseManager
 from django_core.db.models import CommonManager
 from django_core.db.models import TokenManager
 
+from ...cache import get_request_cache
+from ...cache import get_share_cache
+from ...cache import invalidate_shares
+from ...cache import invalidate_user_shares
+from ...constants import SharedObjectsQueryStrategy
 from ...constants import Status
+from ...counters import get_share_counter
+from ...counters import record_share_changes
+from ...registry import get_content_type_id
+from ...registry import get_content_type_ids
+from ...utils import ShareList
+from ...utils import chunks
+from ...utils import sort_shares_by_status
+from .querysets import ShareQuerySet
+from .querysets import SharedObjectQuerySet
+from .querysets import UserShareExists
+
+
+# Attribute on a shared object that holds the user shares bound by
+# ``ShareManager.prefetch_for_user``, keyed by user id.
+USER_SHARE_CACHE_ATTR = '_user_share_cache'
+# Attribute on a shared object that holds the ShareList for the shares that
+# were prefetched with ``prefetch_related``.
+PREFETCHED_SHARES_LIST_ATTR = '_prefetched_shares_list'
 
 
 class ShareManager(CommonManager, TokenManager):
@@ -14,6 +45,22 @@ class ShareManager(CommonManager, TokenManager):
     """Manager for the object share. This manager is used for the share
     object (model) that either extends Share or implements AbstractShare.
     """
+    # Max number of object ids to put in a single query when querying shares
+    # for many shared objects.
+    shared_objects_chunk_size = 500
+
+    def get_queryset(self):
+        queryset = ShareQuerySet(self.model, using=self._db)
+
+        if hasattr(self, 'instance') and hasattr(self, 'content_type'):
+            # Called from a shared object instance so updates to the
+            # queryset only need to invalidate the cached shares for the
+            # instance.
+            queryset = queryset.for_shared_object_keys(
+                keys=[(self.content_type.id, self.instance.pk)]
+            )
+
+        return queryset
 
     def create_for_user(self, created_user, for_user, shared_object=None,
                         status=Status.PENDING, **kwargs):
@@ -27,9 +74,6 @@ class ShareManager(CommonManager, TokenManager):
         :param status: the status of the shared object.
         :param kwargs: can be any keyword args on the sharing model.
         """
-        content_type = (self.content_type
-                        if hasattr(self, 'content_type') else None)
-
         if shared_object is None and hasattr(self, 'instance'):
             shared_object = self.instance
 
@@ -40,14 +84,28 @@ class ShareManager(CommonManager, TokenManager):
                        'last_modified_user': created_user,
                        'status': status})
 
-        if not content_type:
-            content_type = ContentType.objects.get_for_model(
-                model=shared_object)
+        if hasattr(self, 'content_type'):
+            # The generic related manager adds the content type and object id
+            # of the instance itself.
+            lookup = {}
+        else:
+            lookup = {'content_type_id': get_content_type_id(shared_object),
+                      'object_id': shared_object.id}
+
+        with record_share_changes(using=self.db) as changes:
+            share, created = self.get_or_create(for_user=for_user,
+                                                defaults=kwargs,
+                                                **lookup)
 
-        return self.get_or_create(for_user=for_user,
-                                  content_type=content_type,
-                                  object_id=shared_object.id,
-                                  defaults=kwargs)[0]
+            if created:
+                self._shares_created(shares=[share], changes=changes)
+
+        if created:
+            getattr(shared_object, USER_SHARE_CACHE_ATTR, {}).pop(
+                getattr(for_user, 'id', None), None
+            )
+
+        return share
 
     def create_for_non_user(self, created_user, email, first_name, last_name,
                             shared_object=None, message=None,
@@ -67,18 +125,109 @@ class ShareManager(CommonManager, TokenManager):
         if shared_object is None:
             shared_object = self.instance
 
-        return self.create(created_user=created_user,
-                           last_modified_user=created_user,
-                           shared_object=shared_object,
-                           email=email,
-                           first_name=first_name,
-                           last_name=last_name,
-                           message=message,
-                           status=status,
-                           **kwargs)
+        with record_share_changes(using=self.db) as changes:
+            share = self.create(created_user=created_user,
+                                last_modified_user=created_user,
+                                shared_object=shared_object,
+                                email=email,
+                                first_name=first_name,
+                                last_name=last_name,
+                                message=message,
+                                status=status,
+                                **kwargs)
+            self._shares_created(shares=[share], changes=changes)
+
+        return share
+
+    def create_for_users(self, created_user, for_users, shared_object=None,
+                         status=Status.PENDING, **kwargs):
+        """Shares one object with many users at once.  This is the transpose
+        of ``create_many``.  Existing shares are checked with a single query
+        and the new shares are created with a single insert.  Like
+        ``create_for_user``, a user can only have at most 1 share to an
+        object, including through the email of a member.
+
+        :param created_user: the user creating the shares.
+        :param for_users: iterable of users and/or email addresses to share
+            the object with.  Email addresses are used for people who
+            potentially aren't members of the site yet.
+        :param shared_object: the object being shared.  Defaults to the
+            instance when called from an instance of a shared object.
+        :param status: the status of the shares.
+        :param kwargs: can be any keyword args on the sharing model.
+        :return: tuple of (created shares, existing shares).
+        """
+        if shared_object is None and hasattr(self, 'instance'):
+            shared_object = self.instance
+
+        users = []
+        user_ids = set()
+        emails = []
+
+        for for_user in for_users:
+            if isinstance(for_user, string_types):
+                for_user = for_user.lower()
+
+                if for_user not in emails:
+                    emails.append(for_user)
+            elif for_user.id not in user_ids:
+                user_ids.add(for_user.id)
+                users.append(for_user)
+
+        if not users and not emails:
+            return [], []
+
+        # user ids keyed by the lowercased email of the users that are members
+        # with one of the emails {email: set([user_id, ...])}
+        email_user_ids = {}
+
+        if emails:
+            user_model = self.model._meta.get_field('for_user').rel.to
+            email_q = Q()
+
+            for email in emails:
+                email_q |= Q(email__iexact=email)
+
+            for user_id, email in (user_model._default_manager
+                                             .filter(email_q)
+                                             .values_list('id', 'email')):
+                email_user_ids.setdefault(email.lower(), set()).add(user_id)
+
+        content_type_id = get_content_type_id(shared_object)
+        share_user_ids = user_ids.union(*email_user_ids.values())
+        existing_shares = list(self.model.objects.filter(
+            Q(for_user_id__in=share_user_ids) | Q(email__in=emails),
+            content_type_id=content_type_id,
+            object_id=shared_object.id
+        ))
+        existing_user_ids = set(share.for_user_id
+                                for share in existing_shares)
+        existing_emails = set(share.email for share in existing_shares)
+        # The object is already shared with an email if it's shared with the
+        # email or with a member who has the email.
+        shared_user_ids = existing_user_ids | user_ids
+        existing_emails.update(
+            email for email, ids in email_user_ids.items()
+            if ids & shared_user_ids
+        )
+
+        kwargs.update({'shared_object': shared_object,
+                       'created_user': created_user,
+                       'last_modified_user': created_user,
+                       'status': status})
+        shares = [self.model(for_user=user, **kwargs)
+                  for user in users if user.id not in existing_user_ids]
+        shares.extend(self.model(email=email, **kwargs)
+                      for email in emails if email not in existing_emails)
+
+        if not shares:
+            return [], existing_shares
+
+        self.model.save_prep(shares)
+        return self._insert_shares(shares=shares), existing_shares
 
     def create_many(self, objs, for_user, created_user, status=Status.PENDING,
-                    **kwargs):
+                    ignore_conflicts=False, **kwargs):
         """Creates many shares at once of the same object type.  This is
         different from ``bulk_create`` because this can create many shares
         from many different objects of the same content type. For example,
@@ -105,30 +254,106 @@ class ShareManager(CommonManager, TokenManager):
             MUST all be for the same object type!
         :param for_user: the user the shares are for
         :param created_user: the users creating all the shares
+        :param ignore_conflicts: if True and the share model's
+            ``unique_together`` includes (content_type, object_id, for_user),
+            the shares are inserted without first checking for existing
+            shares and the unique constraint is relied on to detect
+            duplicates.  Existing shares are only read if the insert
+            conflicts.  Share models without the constraint always check for
+            existing shares first.
         """
         if not objs:
             return
 
-        obj_ids = [obj.id for obj in objs]
-        content_type = ContentType.objects.get_for_model(objs[0])
-        current_obj_user_shares = self.model.objects.filter(
-            for_user=for_user,
-            object_id__in=obj_ids,
-            content_type=content_type
-        ).values_list('object_id', flat=True)
-
         shares = [self.model(for_user=for_user,
                              shared_object=obj,
                              status=status,
                              created_user=created_user,
                              **kwargs)
-                  for obj in objs if obj.id not in current_obj_user_shares]
+                  for obj in objs]
 
         self.model.save_prep(shares)
+
+        if ignore_conflicts and self._has_unique_user_constraint():
+            created_shares = self._bulk_create_or_none(shares=shares)
+
+            if created_shares is not None:
+                return created_shares
+
+        current_obj_ids = set(self.model.objects.filter(
+            for_user=for_user,
+            object_id__in=[share.object_id for share in shares],
+            content_type_id=shares[0].content_type_id
+        ).values_list('object_id', flat=True))
+
+        shares = [share for share in shares
+                  if share.object_id not in current_obj_ids]
+
         # Don't want to call self.bulk_create here because I don't want the
         # instance associated with the shares since it will be different for
         # each share.
-        return super(ShareManager, self).bulk_create(objs=shares, **kwargs)
+        return self._insert_shares(shares=shares)
+
+    def create_in_batches(self, items, created_user, for_user=None,
+                          shared_object=None, status=Status.PENDING,
+                          batch_size=500, progress_callback=None, **kwargs):
+        """Creates shares for a large number of objects or users by consuming
+        ``items`` in batches of ``batch_size``.  Each batch gets its own check
+        for existing shares, ``save_prep`` and insert so memory use stays flat
+        no matter how many items there are.  ``items`` can be any iterable,
+        including a generator.
+
+        Either ``for_user`` or ``shared_object`` must be provided:
+
+        * for_user: ``items`` are objects of the same type to share with the
+            user (see ``create_many``).
+        * shared_object: ``items`` are users to share the object with.
+
+        >> Share.objects.create_in_batches(items=org.users.iterator(),
+        ..                                 shared_object=project,
+        ..                                 created_user=some_user)
+
+        This should be called from a class and not a class instance.
+
+        :param items: iterable of objects or users to create shares for.
+        :param created_user: the user creating the shares.
+        :param for_user: the user the shares are for.
+        :param shared_object: the object being shared.
+        :param status: the status of the shares.
+        :param batch_size: number of items to process per batch.
+        :param progress_callback: callable that gets called after each batch
+            with the number of items processed and the number of shares
+            created so far.
+        :return: the number of shares created.
+        """
+        if (for_user is None) == (shared_object is None):
+            raise ValueError('Either "for_user" or "shared_object" must be '
+                             'provided, but not both.')
+
+        num_processed = 0
+        num_created = 0
+
+        for batch in chunks(items, batch_size):
+            if for_user is not None:
+                shares = self.create_many(objs=batch,
+                                          for_user=for_user,
+                                          created_user=created_user,
+                                          status=status,
+                                          **kwargs)
+            else:
+                shares = self.create_for_users(shared_object=shared_object,
+                                               for_users=batch,
+                                               created_user=created_user,
+                                               status=status,
+                                               **kwargs)[0]
+
+            num_processed += len(batch)
+            num_created += len(shares or [])
+
+            if progress_callback is not None:
+                progress_callback(num_processed, num_created)
+
+        return num_created
 
     def bulk_create(self, shares, *args, **kwargs):
         """Bulk create's shares for object.
@@ -139,111 +364,643 @@ class ShareManager(CommonManager, TokenManager):
         that share will not be added in the bulk_create.
 
         :param shares: iterable of share objects.
+        :param ignore_conflicts: if True and the share model's
+            ``unique_together`` includes (content_type, object_id, for_user),
+            the shares are inserted without first checking for existing
+            shares and the unique constraint is relied on to detect
+            duplicates.  Existing shares are only read if the insert
+            conflicts.  Share models without the constraint always check for
+            existing shares first.
         """
+        ignore_conflicts = kwargs.pop('ignore_conflicts', False)
+
         if not shares:
             return
 
         if hasattr(self, 'instance') and hasattr(self.instance, 'shares'):
-            current_share_users = [s.for_user
-                                   for s in self.instance.shares.all()
-                                   if s.for_user]
-            shares = [s for s in shares
-                      if s.for_user not in current_share_users]
-
             for share in shares:
                 # TODO: does this need to check for type?  Is this the
                 #       correct behavior?
                 if not share.shared_object:
                     share.shared_object = self.instance
 
-        return super(ShareManager, self).bulk_create(objs=shares, *args,
-                                                     **kwargs)
+            if ignore_conflicts and self._has_unique_user_constraint():
+                created_shares = self._bulk_create_or_none(shares, *args,
+                                                           **kwargs)
+
+                if created_shares is not None:
+                    return created_shares
+
+            current_share_user_ids = set(
+                self.instance.shares.filter(for_user__isnull=False)
+                                    .values_list('for_user_id', flat=True)
+            )
+            shares = [s for s in shares
+                      if s.for_user_id not in current_share_user_ids]
+
+        return self._insert_shares(shares, *args, **kwargs)
 
     def get_for_user(self, user, **kwargs):
-        """Gets a shared objects for user."""
+        """Gets a shared objects for user.
+
+        When called from an instance of a shared object, the user's share is
+        read from memory without a query if the shares have already been
+        prefetched, bound with ``prefetch_for_user`` or loaded into the
+        request share cache.
+        """
         if not user.is_authenticated():
             return None
 
-        # TODO: could optimize this to first look and see if the shares have
-        #       already been prefetched.  If so, do the loop, it not don't make
-        #       the call to pull back all the shares.
-        if hasattr(self, 'instance') and hasattr(self.instance, 'shares'):
-            for share in self.instance.shares.all():
-                if share.for_user_id == user.id:
-                    return share
-
-        queryset = self.filter(for_user=user, **kwargs)
-
         # If there isn't an ``instance`` then this was not called from an
         # instance of an object so all shares for a user will be returned.
         if not hasattr(self, 'instance'):
-            return queryset
+            return self.filter(for_user=user, **kwargs)
+
+        if not kwargs:
+            prefetched_shares = self._get_prefetched_shares_list()
+
+            if prefetched_shares is not None:
+                return prefetched_shares.get_for_user_id(user.id)
 
+            user_shares = getattr(self.instance, USER_SHARE_CACHE_ATTR, {})
+
+            if user.id in user_shares:
+                return user_shares[user.id]
+
+            if get_request_cache() is not None:
+                return self.get_shares_list().get_for_user_id(user.id)
+
+            share_cache = get_share_cache()
+
+            if share_cache is not None:
+                return share_cache.get_user_share(
+                    key=(self.content_type.id, self.instance.pk),
+                    user_id=user.id,
+                    loader=lambda: self._get_instance_user_share(user)
+                )
+
+        return self._get_instance_user_share(user, **kwargs)
+
+    def _get_instance_user_share(self, user, **kwargs):
+        """Gets the user's share for the instance from the database."""
         try:
             # This is being called from an object instance and since a user
             # can only have 1 share per user, return that share.
-            return queryset.get()
-        except:
+            return self.filter(for_user=user, **kwargs).get()
+        except (self.model.DoesNotExist, self.model.MultipleObjectsReturned):
             return None
 
+    def prefetch_for_user(self, user, objs):
+        """Gets a user's shares for many shared objects in a single query and
+        binds each share to its shared object so subsequent calls to
+        ``obj.shares.get_for_user(user)`` don't make a query.  The objects can
+        be of different types.
+
+        This should be called from a class and not a class instance.
+
+        >> Share.objects.prefetch_for_user(user=some_user, objs=objs)
+        >> objs[0].shares.get_for_user(some_user)  # no query
+
+        :param user: the user to get the shares for.
+        :param objs: iterable of shared objects.
+        :return: list of the user's shares for the shared objects.
+        """
+        objs = list(objs)
+
+        if not objs:
+            return []
+
+        shares_by_key = self.get_for_user_by_shared_objects(user=user,
+                                                            objs=objs)
+        content_type_ids = get_content_type_ids(obj.__class__ for obj in objs)
+
+        for obj in objs:
+            share = shares_by_key.get((content_type_ids[obj.__class__],
+                                       obj.pk))
+
+            if share is not None:
+                share.shared_object = obj
+
+            if not hasattr(obj, USER_SHARE_CACHE_ATTR):
+                setattr(obj, USER_SHARE_CACHE_ATTR, {})
+
+            getattr(obj, USER_SHARE_CACHE_ATTR)[user.id] = share
+
+        return list(shares_by_key.values())
+
+    def get_shares_list(self):
+        """Gets a list of all the shares for the shared object.  This must be
+        called from an instance of a shared object (i.e. ``obj.shares``).
+
+        The shares are loaded with a single query that joins the share users
+        and each share's ``shared_object`` is bound to the instance instead of
+        being fetched again.  If the request share cache is active, the shares
+        are loaded at most once per request and read from the cache
+        afterwards.
+
+        :return: ShareList of the shares for the shared object.
+        """
+        prefetched_shares = self._get_prefetched_shares_list()
+
+        if prefetched_shares is not None:
+            return prefetched_shares
+
+        request_cache = get_request_cache()
+
+        if request_cache is None:
+            return ShareList(self._load_shares())
+
+        return request_cache.get_shares(
+            key=(self.content_type.id, self.instance.pk),
+            loader=self._load_shares
+        )
+
+    def get_sharing_for_user(self, user):
+        """Gets all of the sharing for the shared object that a view needs in
+        a single call: the shares sorted by status and the user's share.  This
+        must be called from an instance of a shared object (i.e.
+        ``obj.shares``).
+
+        Everything is read from the single fetch of ``get_shares_list`` so
+        this makes at most one query and nothing returned queries lazily.
+        This makes it the one call to wrap with ``sync_to_async`` from an
+        async view.
+
+        :param user: the user to get the share for.  Can be an anonymous user.
+        :return: tuple of (shares, shares by status, user share) where shares
+            is a ShareList of all the shares, shares by status is a dict of
+            ShareLists keyed by status and user share is None if the user
+            doesn't have a share.
+        """
+        shares = self.get_shares_list()
+        user_share = (shares.get_for_user_id(user.id)
+                      if user.is_authenticated() else None)
+        return shares, sort_shares_by_status(shares), user_share
+
+    def get_status_counts(self):
+        """Gets the number of shares by status for the shared object.  This
+        must be called from an instance of a shared object (i.e.
+        ``obj.shares``).
+
+        If a share counter is enabled (see ``django_shares.counters``), the
+        counts are read from the counter.  Otherwise they're computed with a
+        single GROUP BY query.
+
+        :return: dict of share counts keyed by status.
+
+        Example:
+
+        {'ACCEPTED': 10,
+         'DECLINED': 0,
+         'DELETED': 1,
+         'PENDING': 3,
+         'INACTIVE': 0}
+        """
+        def load():
+            counts = dict((status, 0) for status in Status.get_keys())
+            counts.update(self.order_by()
+                              .values_list('status')
+                              .annotate(count=Count('id')))
+            return counts
+
+        counter = get_share_counter()
+
+        if counter is None:
+            return load()
+
+        return counter.get_counts(key=(self.content_type.id, self.instance.pk),
+                                  loader=load)
+
+    def has_access(self, user, content_type_id, object_id, statuses=None,
+                   use_cache=True):
+        """Boolean indicating if a user has a share to a shared object.  This
+        doesn't need the shared object to be fetched.
+
+        :param user: the user to check access for.
+        :param content_type_id: the content type id of the shared object.
+        :param object_id: the id of the shared object.
+        :param statuses: iterable of share statuses that give access.  If
+            None, a share with any status gives access.
+        :param use_cache: if True and the shared cache is enabled (see
+            ``django_shares.cache``), the user's share is read from the cache.
+            Otherwise an EXISTS query is made.
+        """
+        if not user.is_authenticated():
+            return False
+
+        queryset = self.filter(for_user=user,
+                               content_type_id=content_type_id,
+                               object_id=object_id)
+        share_cache = get_share_cache() if use_cache else None
+
+        if share_cache is not None:
+            share = share_cache.get_user_share(
+                key=(content_type_id, object_id),
+                user_id=user.id,
+                loader=queryset.first
+            )
+            return (share is not None and
+                    (statuses is None or share.status in statuses))
+
+        if statuses is not None:
+            queryset = queryset.filter(status__in=statuses)
+
+        return queryset.exists()
+
+    def get_accessible_object_ids(self, user, statuses=None, use_cache=True):
+        """Gets the ids of all the objects shared with a user with a single
+        query.  The ids are stored compactly as sorted arrays of unsigned ints
+        so the result is cheap to cache even for users with many shares.
+
+        This should be called from a class and not a class instance.
+
+        :param user: the user to get the object ids for.
+        :param statuses: iterable of share statuses to include.  If None,
+            shares with any status are included.
+        :param use_cache: if True and the shared cache is enabled (see
+            ``django_shares.cache``), the ids are read from the cache.
+        :return: dict of sorted ``array('I')`` object ids keyed by content type
+            id.
+
+        Example:
+
+        {12: array('I', [1, 5, 9]),
+         15: array('I', [3])}
+        """
+        share_cache = get_share_cache() if use_cache else None
+
+        if share_cache is None:
+            return self._get_accessible_object_ids(user=user,
+                                                   statuses=statuses)
+
+        return share_cache.get_user_value(
+            user_id=user.id,
+            name='object_ids:{0}'.format(
+                ','.join(sorted(statuses)) if statuses is not None else 'all'
+            ),
+            loader=lambda: self._get_accessible_object_ids(user=user,
+                                                           statuses=statuses)
+        )
+
+    def _get_accessible_object_ids(self, user, statuses=None):
+        """Gets the ids of all the objects shared with a user from the
+        database.  See ``get_accessible_object_ids``.
+        """
+        queryset = self.filter(for_user=user)
+
+        if statuses is not None:
+            queryset = queryset.filter(status__in=statuses)
+
+        object_ids_by_content_type = {}
+        values = queryset.order_by('content_type_id', 'object_id').values_list(
+            'content_type_id',
+            'object_id'
+        ).distinct()
+
+        for content_type_id, object_id in values.iterator():
+            if content_type_id not in object_ids_by_content_type:
+                object_ids_by_content_type[content_type_id] = array(str('I'))
+
+            object_ids_by_content_type[content_type_id].append(object_id)
+
+        return object_ids_by_content_type
+
     def get_for_user_id(self, user_id, **kwargs):
         """Gets a shared objects for a user by user id."""
         return self.filter(for_user_id=user_id, **kwargs)
 
-    def get_by_email(self, email, **kwargs):
-        """Gets shares by an email."""
-        # TODO: To lower()?
-        queryset = self.filter(Q(email=email) | Q(for_user__email=email),
-                               **kwargs)
+    def get_by_email(self, email, include_users=True, **kwargs):
+        """Gets shares by an email, case-insensitive.  Matches shares sent to
+        the email as well as shares for users with the email.
+
+        Share emails are stored lowercase (see ``AbstractShare.save_prep``
+        and the ``normalize_share_emails`` command) so they're matched with
+        the share email index.  The ids of the users with the email are
+        looked up first with a case-insensitive match on the user table
+        instead of joining the share table to it.  Django doesn't index the
+        user email so that lookup scans the user table unless an index for
+        case-insensitive matches is added (see the README).
+
+        :param email: the email to get the shares for.
+        :param include_users: if False, only shares sent to the email are
+            matched and the user table isn't queried.
+        """
+        if not email:
+            return None if hasattr(self, 'instance') else self.none()
+
+        user_ids = []
+
+        if include_users:
+            user_model = self.model._meta.get_field('for_user').rel.to
+            user_ids = list(user_model._default_manager
+                                      .filter(email__iexact=email)
+                                      .values_list('id', flat=True))
+
+        q = Q(email=email.lower())
+
+        if user_ids:
+            q |= Q(for_user_id__in=user_ids)
+
+        queryset = self.filter(q, **kwargs)
 
         if not hasattr(self, 'instance'):
             return queryset
 
         try:
             return queryset.get()
-        except:
+        except (self.model.DoesNotExist, self.model.MultipleObjectsReturned):
+            return None
+
+    def get_for_token(self, token, use_cache=True):
+        """Gets a share by token with the share's content type and user
+        selected in the same query.  The shared object isn't fetched until
+        it's accessed.
+
+        This should be called from a class and not a class instance.
+
+        :param token: the share token.
+        :param use_cache: if True, the share is read from the shared share
+            cache when it's enabled.
+        :return: the share or None if there isn't a share with the token.
+        """
+        if not token:
             return None
 
+        queryset = self.select_related('content_type', 'for_user')
+
+        def load():
+            try:
+                return queryset.get(token=token)
+            except self.model.DoesNotExist:
+                return None
+
+        share_cache = get_share_cache() if use_cache else None
+
+        if share_cache is None or hasattr(self, 'instance'):
+            return load()
+
+        return share_cache.get_token_share(token=token, loader=load)
+
     def get_by_shared_object(self, obj, **kwargs):
         """Gets all shares for an object.
 
         :param obj: object to get shares for.
         """
-        content_type = ContentType.objects.get_for_model(obj)
-        return self.filter(content_type=content_type, object_id=obj.id,
+        return self.filter(content_type_id=get_content_type_id(obj),
+                           object_id=obj.id,
                            **kwargs)
 
     def get_by_shared_objects(self, objs, **kwargs):
-        """Gets all shares for an iterable of shared objects.
+        """Gets all shares for an iterable of shared objects.  For a large
+        number of objects use ``iter_by_shared_objects`` instead.
+
+        :param objs: a list or other iterable of objects to get the shares for.
+        """
+        obj_ids_by_content_type = self._get_obj_ids_by_content_type(objs)
+
+        if not obj_ids_by_content_type:
+            return self.none()
+
+        return self.filter(self._get_shared_objects_q(obj_ids_by_content_type),
+                           **kwargs)
+
+    def iter_by_shared_objects(self, objs, strategy=None, chunk_size=None,
+                               **kwargs):
+        """Lazily iterates over all shares for an iterable of shared objects.
+        Unlike ``get_by_shared_objects``, this scales to a large number of
+        objects by splitting the object ids into chunks and only running the
+        query for a chunk once the shares before it have been consumed.
 
         :param objs: a list or other iterable of objects to get the shares for.
+        :param strategy: the query strategy.  One of
+            django_shares.constants.SharedObjectsQueryStrategy.  If None, OR is
+            used when all the object ids fit in a single chunk, otherwise
+            VALUES is used on backends that support it and PER_CONTENT_TYPE
+            elsewhere.
+        :param chunk_size: the max number of object ids per query.  Defaults
+            to ``shared_objects_chunk_size``.
+        :param kwargs: additional filters for the shares.
+        """
+        if chunk_size is None:
+            chunk_size = self.shared_objects_chunk_size
+
+        obj_ids_by_content_type = self._get_obj_ids_by_content_type(objs)
+        num_obj_ids = sum(len(obj_ids)
+                          for obj_ids in obj_ids_by_content_type.values())
+
+        if strategy is None:
+            strategy = (SharedObjectsQueryStrategy.OR
+                        if num_obj_ids <= chunk_size
+                        else SharedObjectsQueryStrategy.VALUES)
+
+        if (strategy == SharedObjectsQueryStrategy.VALUES and
+            not self._supports_values_join()):
+            strategy = SharedObjectsQueryStrategy.PER_CONTENT_TYPE
+
+        if not obj_ids_by_content_type:
+            querysets = []
+        elif strategy == SharedObjectsQueryStrategy.OR:
+            querysets = [self.filter(
+                self._get_shared_objects_q(obj_ids_by_content_type),
+                **kwargs
+            )]
+        elif strategy == SharedObjectsQueryStrategy.VALUES:
+            keys = ((content_type_id, obj_id)
+                    for content_type_id, obj_ids
+                    in obj_ids_by_content_type.items()
+                    for obj_id in obj_ids)
+            querysets = (self._filter_by_shared_object_keys(keys=chunk,
+                                                            **kwargs)
+                         for chunk in chunks(keys, chunk_size))
+        else:
+            querysets = (self.filter(content_type_id=content_type_id,
+                                     object_id__in=chunk,
+                                     **kwargs)
+                         for content_type_id, obj_ids
+                         in obj_ids_by_content_type.items()
+                         for chunk in chunks(obj_ids, chunk_size))
+
+        return chain.from_iterable(queryset.iterator()
+                                   for queryset in querysets)
+
+    def get_for_user_by_shared_objects(self, user, objs, **kwargs):
+        """Gets a user's shares for an iterable of shared objects in a single
+        query.  The objects can be of different types.
+
+        This should be called from a class and not a class instance.
+
+        :param user: the user to get the shares for.
+        :param objs: a list or other iterable of objects to get the shares for.
+        :return: dict of shares keyed by (content_type_id, object_id) of the
+            shared object.  Objects the user doesn't have a share to are not
+            in the dict.
+
+        Example:
+
+        {(12, 1): <Share 43>,
+         (12, 2): <Share 44>,
+         (15, 1): <Share 45>}
+        """
+        shares = self.get_by_shared_objects(objs=objs, for_user=user,
+                                            **kwargs)
+        return dict(((share.content_type_id, share.object_id), share)
+                    for share in shares)
+
+    def _get_obj_ids_by_content_type(self, objs):
+        """Gets a dict of object ids keyed by the content type id of the
+        objects.
+
+        {12: [123, 234, 345]}
         """
-        obj_models = set([])
         # gets a dict of obj ids keyed by model {model: [123, 234, 345]}
         obj_ids_by_model = {}
 
         for obj in objs:
             model_cls = obj.__class__
-            obj_models.add(model_cls)
 
             if model_cls not in obj_ids_by_model:
                 obj_ids_by_model[model_cls] = []
 
             obj_ids_by_model[model_cls].append(obj.id)
 
-        # get content types by models {model: content_type}
-        content_types_by_model = ContentType.objects.get_for_models(*obj_models)
+        if not obj_ids_by_model:
+            return {}
+
+        # get content type ids by models {model: content_type_id}
+        content_type_ids = get_content_type_ids(obj_ids_by_model.keys())
 
+        return dict((content_type_id, obj_ids_by_model[obj_model])
+                    for obj_model, content_type_id
+                    in content_type_ids.items())
+
+    def _get_shared_objects_q(self, obj_ids_by_content_type):
+        """Gets the Q object that matches shares for the object ids keyed by
+        content type id.
+        """
         q = None
 
-        for obj_model, content_type in content_types_by_model.items():
-            obj_ids = obj_ids_by_model[obj_model]
-            new_query = (Q(content_type=content_type) &
+        for content_type_id, obj_ids in obj_ids_by_content_type.items():
+            new_query = (Q(content_type_id=content_type_id) &
                          Q(object_id__in=obj_ids))
             q = new_query if q is None else q | new_query
 
+        return q
+
+    def _has_unique_user_constraint(self):
+        """Boolean indicating if the share model has a unique constraint on
+        (content_type, object_id, for_user) so a user can't have more than 1
+        share to an object.  ``AbstractShare`` doesn't declare it so custom
+        share models might not have it.
+        """
+        fields = set(['content_type', 'object_id', 'for_user'])
+        return any(set(field_names) == fields
+                   for field_names in self.model._meta.unique_together)
+
+    def _bulk_create_or_none(self, shares, *args, **kwargs):
+        """Inserts all the shares in a single statement.  If any of the shares
+        conflict with an existing share, nothing is inserted and None is
+        returned.
+        """
+        try:
+            with transaction.atomic(using=self.db):
+                return self._insert_shares(shares, *args, **kwargs)
+        except IntegrityError:
+            return None
+
+    def _insert_shares(self, shares, *args, **kwargs):
+        """Inserts the shares with a single bulk insert."""
+        with record_share_changes(using=self.db) as changes:
+            shares = super(ShareManager, self).bulk_create(objs=shares,
+                                                           *args, **kwargs)
+            self._shares_created(shares=shares, changes=changes)
+
+        return shares
+
+    def _supports_values_join(self):
+        """Boolean indicating if the database supports comparing
+        (content_type_id, object_id) pairs against a VALUES list.
+        """
+        return connections[self.db].vendor == 'postgresql'
+
+    def _filter_by_shared_object_keys(self, keys, **kwargs):
+        """Filters shares by joining on a VALUES list of the shared object
+        keys.
+
+        :param keys: list of (content_type_id, object_id) tuples.
+        """
+        opts = self.model._meta
+        quote_name = connections[self.db].ops.quote_name
+        table = quote_name(opts.db_table)
+        where = '({0}.{1}, {0}.{2}) IN (VALUES {3})'.format(
+            table,
+            quote_name(opts.get_field('content_type').column),
+            quote_name(opts.get_field('object_id').column),
+            ', '.join(['(%s, %s)'] * len(keys))
+        )
+        params = [value for key in keys for value in key]
+        return self.filter(**kwargs).extra(where=[where], params=params)
+
+    def _load_shares(self):
+        """Loads the shares for the instance with the share users and binds
+        the instance as each share's shared object.
+        """
+        queryset = self.all().select_related('for_user', 'created_user')
+        share_cache = get_share_cache()
+
+        if share_cache is None:
+            shares = list(queryset)
+        else:
+            shares = share_cache.get_shares(
+                key=(self.content_type.id, self.instance.pk),
+                loader=lambda: queryset
+            )
+
+        # The shared object is bound after reading from the cache so it's not
+        # stored with every share.
+        for share in shares:
+            share.shared_object = self.instance
+
+        return shares
+
+    def _get_prefetched_shares_list(self):
+        """Gets the ShareList of the instance's shares if they've already been
+        prefetched (i.e. ``prefetch_related('shares')``) or None if they
+        haven't.
+        """
+        prefetch_cache_name = getattr(self, 'prefetch_cache_name', None)
+
+        try:
+            prefetched = self.instance._prefetched_objects_cache[
+                prefetch_cache_name
+            ]
+        except (AttributeError, KeyError):
+            return None
+
+        # Memoize the list on the instance so the lookup by user id is only
+        # built once for the prefetched shares.
+        cached = getattr(self.instance, PREFETCHED_SHARES_LIST_ATTR, None)
 
-        return self.filter(q, **kwargs)
+        if cached is None or cached[0] is not prefetched:
+            cached = (prefetched, ShareList(prefetched))
+            setattr(self.instance, PREFETCHED_SHARES_LIST_ATTR, cached)
+
+        return cached[1]
+
+    def _shares_created(self, shares, changes=None):
+        """Invalidates any cached shares for the shared objects of the newly
+        created shares and records the new shares in ``changes`` for the
+        share counter.
+        """
+        invalidate_shares(keys=set((share.content_type_id, share.object_id)
+                                   for share in shares))
+        invalidate_user_shares(user_ids=set(share.for_user_id
+                                            for share in shares
+                                            if share.for_user_id))
+
+        if changes is not None:
+            changes.extend(((share.content_type_id, share.object_id), None,
+                            share.status, 1)
+                           for share in shares)
 
 
 class SharedObjectManager(BaseManager):
@@ -257,15 +1014,78 @@ class SharedObjectManager(BaseManager):
     Note: this manager assumes you're calling the shares "shares".
     """
 
-    def get_for_user(self, for_user, status=None, **kwargs):
+    def get_queryset(self):
+        return SharedObjectQuerySet(self.model, using=self._db)
+
+    def get_for_user(self, for_user, status=None, annotate_status=False,
+                     **kwargs):
         """Get objects that are being shared with this user.
 
+        The shares are matched with a correlated EXISTS subquery on the share
+        table with an explicit content type instead of a join through the
+        generic relation so each object is only returned once and the
+        (content_type, object_id) index can be used.
+
         :param for_user: the user to get the objects for.
         :param status: status of the share.  If None, all status' will be
             returned.  Otherwise, can be one of django_shares.constants.Status
-            values.
+            values or an iterable of them.
+        :param annotate_status: if True, the status of the user's share is
+            added to each object as ``user_share_status``.
+        """
+        queryset = self.filter(**kwargs)
+        queryset.query.where.add(UserShareExists(model=self.model,
+                                                 for_user=for_user,
+                                                 status=status),
+                                 AND)
+
+        if annotate_status:
+            queryset = queryset.with_user_share(user=for_user,
+                                                fields=('status',))
+
+        return queryset
+
+    def with_user_share(self, user, fields=('status', 'id', 'token')):
+        """Annotates each object with fields from the user's share to the
+        object.  See ``SharedObjectQuerySet.with_user_share``.
+        """
+        return self.get_queryset().with_user_share(user=user, fields=fields)
+
+    def filter_accessible(self, for_user, statuses=None,
+                          subquery_threshold=500):
+        """Filters the objects to those shared with a user without joining
+        through the generic relation.  The ids of the objects shared with the
+        user come from ``ShareManager.get_accessible_object_ids`` which can be
+        cached.
+
+        :param for_user: the user to get the objects for.
+        :param statuses: iterable of share statuses to include.  If None,
+            shares with any status are included.
+        :param subquery_threshold: max number of ids bound in the ``pk__in``
+            clause.  If the user has more shared objects than this, the
+            objects are filtered with a subquery on the share table instead
+            so the query stays under the database's bound parameter limit
+            (999 for older versions of SQLite).
         """
-        if status is not None:
-            kwargs['shares__status'] = status
+        content_type_id = get_content_type_id(self.model)
+        share_model = self.model.get_share_class()
+        object_ids = share_model.objects.get_accessible_object_ids(
+            user=for_user,
+            statuses=statuses
+        ).get(content_type_id)
+
+        if not object_ids:
+            return self.none()
+
+        if len(object_ids) <= subquery_threshold:
+            return self.filter(pk__in=object_ids)
+
+        share_queryset = share_model.objects.filter(
+            for_user=for_user,
+            content_type_id=content_type_id
+        )
+
+        if statuses is not None:
+            share_queryset = share_queryset.filter(status__in=statuses)
 
-        return self.filter(shares__for_user=for_user, **kwargs)
+        return self.filter(pk__in=share_queryset.values('object_id'))
@@ -1,7 +1,11 @@
+from datetime import datetime
+
 from django.db import models
 from django_core.db.models.mixins.crud import AbstractSafeDeleteModelMixin
 
 from ...constants import Status
+from ...counters import record_share_changes
+from ...registry import get_share_model
 from .managers import SharedObjectManager
 
 
@@ -34,8 +38,24 @@ class AbstractSharedObjectModelMixin(models.Model):
 
     @classmethod
     def get_share_class(cls):
-        """Gets the class instance associated to the "shares" model field."""
-        return cls().shares.model
+        """Gets the class instance associated to the "shares" model field.
+
+        The class is resolved from the "shares" generic relation in the
+        model's ``_meta`` and cached on the model class.
+        """
+        share_class = cls.__dict__.get('_share_class')
+
+        if share_class is None:
+            share_class = get_share_model(cls)
+
+            if share_class is None:
+                # "shares" isn't a generic relation so the model has to be
+                # instantiated to get to it.
+                share_class = cls().shares.model
+
+            cls._share_class = share_class
+
+        return share_class
 
 
 class SafeDeleteShareModelMixin(models.Model):
@@ -46,10 +66,110 @@ class SafeDeleteShareModelMixin(models.Model):
     class Meta:
         abstract = True
 
-    def delete_safe(self):
-        """Sets the status to DELETED."""
-        self.status = Status.DELETED
-        self.save()
+    def delete_safe(self, expected_status=None):
+        """Sets the status to DELETED.  See ``update_share_status``.
+
+        :param expected_status: if provided, the object is only deleted if
+            its status in the database is still this status.
+        :return: boolean indicating if the object was updated.
+        """
+        return update_share_status(self, status=Status.DELETED,
+                                   expected_status=expected_status)
+
+
+def update_share_status(share, status, expected_status=None, **kwargs):
+    """Updates the status of a share and records the change in the share
+    counter.
+
+    Without ``expected_status``, the share is saved with ``update_fields``
+    so the pre_save and post_save signals are sent as usual.  The old status
+    for the share counts is read from the database instead of the instance
+    so a stale instance can't skew the counts.
+
+    With ``expected_status``, the update is a compare and swap: a single
+    conditional UPDATE that only changes the share if its status in the
+    database is still the expected status.  The save signals are not sent
+    for a compare and swap.
+
+    :param share: the share to update.
+    :param status: the new status of the share.
+    :param expected_status: the status the share must have in the database
+        for it to be updated.
+    :param kwargs: additional fields to update.
+    :return: boolean indicating if the share was updated.
+    """
+    kwargs['status'] = status
+
+    if share.pk is None:
+        for attr, value in kwargs.items():
+            setattr(share, attr, value)
+
+        share.save()
+        return True
+
+    field_names = set(field.name for field in share._meta.fields)
+    key = ((share.content_type_id, share.object_id)
+           if 'content_type' in field_names else None)
+    manager = share.__class__._default_manager
+    using = share._state.db or manager.db
+
+    if expected_status is None:
+        with record_share_changes(using=using) as changes:
+            old_status = None
+
+            if changes is not None and key is not None:
+                old_status = (manager.db_manager(using)
+                                     .select_for_update()
+                                     .filter(pk=share.pk)
+                                     .values_list('status', flat=True)
+                                     .first())
+
+                if old_status is None:
+                    # The share doesn't exist anymore.
+                    return False
+
+            for attr, value in kwargs.items():
+                setattr(share, attr, value)
+
+            # save_prep can also set the last modified and response times.
+            update_fields = field_names.intersection(
+                list(kwargs) + ['last_modified_dttm', 'response_dttm']
+            )
+            share.save(using=using, update_fields=update_fields)
+
+            if old_status is not None:
+                changes.append((key, old_status, status, 1))
+
+        return True
+
+    if 'last_modified_dttm' in field_names:
+        kwargs['last_modified_dttm'] = datetime.utcnow()
+
+    queryset = manager.db_manager(using).filter(pk=share.pk,
+                                                status=expected_status)
+
+    if key is not None and hasattr(queryset, 'for_shared_object_keys'):
+        queryset = queryset.for_shared_object_keys(
+            keys=[key],
+            user_ids=[getattr(share, 'for_user_id', None)]
+        )
+
+    with record_share_changes(using=using) as changes:
+        num_updated = queryset.update(**dict(
+            (attr, value) for attr, value in kwargs.items()
+            if attr in field_names
+        ))
+
+        # Only shares with the expected status were updated so it's the
+        # exact old status of the updated share.
+        if num_updated and changes is not None and key is not None:
+            changes.append((key, expected_status, status, num_updated))
+
+    if num_updated:
+        for attr, value in kwargs.items():
+            setattr(share, attr, value)
+
+    return num_updated > 0
 
 
 class AbstractSafeDeleteSharedObjectModelMixin(AbstractSafeDeleteModelMixin):
@@ -66,4 +186,4 @@ class AbstractSafeDeleteSharedObjectModelMixin(AbstractSafeDeleteModelMixin):
     def delete_safe(self):
         super(AbstractSafeDeleteSharedObjectModelMixin, self).delete_safe()
         # Update status to all shares for this object
-        self.shares.all().update(status=Status.DELETED)
+        self.shares.all().delete_safe()
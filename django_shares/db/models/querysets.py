@@ -0,0 +1,341 @@
+from __future__ import unicode_literals
+
+from datetime import datetime
+
+from django.db import connections
+from django.db.models import Count
+from django.db.models.query import QuerySet
+from django.utils.six import string_types
+
+from ...cache import invalidate_shares
+from ...cache import invalidate_user_shares
+from ...constants import Status
+from ...counters import record_share_changes
+from ...pagination import get_keyset_page
+from ...registry import get_content_type_id
+from ...utils import chunks
+
+
+def get_user_share_subquery(model, for_user, select='1', status=None,
+                            using='default', outer_alias=None):
+    """Gets the SQL for a subquery on the share table that's correlated to
+    the shared object table of a queryset and matches the user's share to
+    each shared object.  The content type is explicit so the
+    (content_type, object_id) index on the share table can be used.
+
+    :param model: the shared object model.
+    :param for_user: the user or user id the shares are for.
+    :param select: the share column to select.
+    :param status: a share status or iterable of share statuses the share
+        must have.  If None, the share can have any status.
+    :param using: the database alias.
+    :param outer_alias: the quoted alias of the shared object table in the
+        outer query.  Defaults to the shared object table name.
+    :return: tuple of (sql, params).
+    """
+    share_opts = model.get_share_class()._meta
+    quote_name = connections[using].ops.quote_name
+    alias = quote_name('user_share')
+
+    if outer_alias is None:
+        outer_alias = quote_name(model._meta.db_table)
+
+    where = [
+        '{0}.{1} = %s'.format(
+            alias, quote_name(share_opts.get_field('content_type').column)
+        ),
+        '{0}.{1} = {2}.{3}'.format(
+            alias,
+            quote_name(share_opts.get_field('object_id').column),
+            outer_alias,
+            quote_name(model._meta.pk.column)
+        ),
+        '{0}.{1} = %s'.format(
+            alias, quote_name(share_opts.get_field('for_user').column)
+        ),
+    ]
+    params = [get_content_type_id(model), getattr(for_user, 'pk', for_user)]
+
+    if status is not None:
+        statuses = [status] if isinstance(status, string_types) else status
+        where.append('{0}.{1} IN ({2})'.format(
+            alias,
+            quote_name(share_opts.get_field('status').column),
+            ', '.join(['%s'] * len(statuses))
+        ))
+        params.extend(statuses)
+
+    if select != '1':
+        select = '{0}.{1}'.format(
+            alias, quote_name(share_opts.get_field(select).column)
+        )
+
+    sql = 'SELECT {0} FROM {1} {2} WHERE {3}'.format(
+        select,
+        quote_name(share_opts.db_table),
+        alias,
+        ' AND '.join(where)
+    )
+    return sql, params
+
+
+class UserShareExists(object):
+    """Where clause for a correlated EXISTS subquery that matches the user's
+    share to each shared object (see ``get_user_share_subquery``).  The alias
+    of the shared object table is resolved when the query is compiled so the
+    subquery stays correlated to the right table when the queryset is nested
+    in another query (i.e. ``filter(obj__in=queryset)``) and its tables are
+    relabeled.
+
+    :param model: the shared object model.
+    :param for_user: the user or user id the shares are for.
+    :param status: a share status or iterable of share statuses the share
+        must have.  If None, the share can have any status.
+    :param alias: the alias of the shared object table.  Defaults to the
+        shared object table name.
+    """
+    contains_aggregate = False
+
+    def __init__(self, model, for_user, status=None, alias=None):
+        self.model = model
+        self.for_user = for_user
+        self.status = status
+        self.alias = alias or model._meta.db_table
+
+    def as_sql(self, qn, connection):
+        quote_name = getattr(qn, 'quote_name_unless_alias', qn)
+        sql, params = get_user_share_subquery(
+            model=self.model,
+            for_user=self.for_user,
+            status=self.status,
+            using=connection.alias,
+            outer_alias=quote_name(self.alias)
+        )
+        return 'EXISTS ({0})'.format(sql), params
+
+    def clone(self):
+        return self.__class__(model=self.model,
+                              for_user=self.for_user,
+                              status=self.status,
+                              alias=self.alias)
+
+    def relabel_aliases(self, change_map):
+        self.alias = change_map.get(self.alias, self.alias)
+
+    def relabeled_clone(self, change_map):
+        clone = self.clone()
+        clone.relabel_aliases(change_map)
+        return clone
+
+
+class ShareQuerySet(QuerySet):
+
+    """QuerySet for the object share.  Status transitions on the queryset
+    update all the shares with a single UPDATE instead of saving each share.
+
+    >> Share.objects.filter(for_user=departed_user).inactivate(
+    ..     last_modified_user=admin_user)
+    5000
+
+    Updating the queryset invalidates the cached shares.  If the shared
+    objects the shares are for are known (see ``for_shared_object_keys``),
+    only their cached shares are invalidated.  Otherwise all cached shares are
+    invalidated.
+    """
+    _shared_object_keys = None
+    _share_user_ids = None
+
+    def for_shared_object_keys(self, keys, user_ids=None):
+        """Returns a clone of the queryset that knows the shares in it only
+        belong to these shared objects.  This doesn't filter the queryset.
+
+        :param keys: iterable of (content_type_id, object_id) tuples.
+        :param user_ids: iterable of the ids of the users the shares are for
+            if they're known.
+        """
+        clone = self._clone()
+        clone._shared_object_keys = list(keys)
+
+        if user_ids is not None:
+            # Shares that aren't for a site user don't affect any user.
+            clone._share_user_ids = [user_id for user_id in user_ids
+                                     if user_id]
+
+        return clone
+
+    def update(self, **kwargs):
+        num_updated = super(ShareQuerySet, self).update(**kwargs)
+        # Invalidated after the write so a concurrent read can't cache the
+        # shares from before the update.
+        invalidate_shares(keys=self._shared_object_keys)
+        invalidate_user_shares(user_ids=self._share_user_ids)
+        return num_updated
+
+    def _clone(self, *args, **kwargs):
+        clone = super(ShareQuerySet, self)._clone(*args, **kwargs)
+        clone._shared_object_keys = self._shared_object_keys
+        clone._share_user_ids = self._share_user_ids
+        return clone
+
+    def keyset_page(self, cursor=None, page_size=25, ordering='-id'):
+        """Gets a page of the shares with keyset pagination.  Unlike OFFSET
+        pagination, deep pages cost the same as the first page.
+
+        >> page = Share.objects.get_for_user(user).keyset_page()
+        >> next_page = Share.objects.get_for_user(user).keyset_page(
+        ..     cursor=page.next_cursor)
+
+        :param cursor: the opaque cursor from the previous page.  If None, the
+            first page is returned.
+        :param page_size: the number of shares on the page.
+        :param ordering: the ordering of the shares.  One of "-id", "id",
+            "-last_sent" or "last_sent".  Shares ordered by last_sent are
+            also ordered by id.
+        :raises ValueError: if the cursor is invalid.
+        :return: django_shares.pagination.KeysetPage
+        """
+        return get_keyset_page(queryset=self,
+                               cursor=cursor,
+                               page_size=page_size,
+                               ordering=ordering)
+
+    def accept(self, last_modified_user=None, batch_size=None, **kwargs):
+        """Accepts all the shares in the queryset.
+
+        :param last_modified_user: the user accepting the shares.
+        :param batch_size: if provided, the shares are updated in batches of
+            this many shares.
+        :param kwargs: additional fields to update on the shares.
+        :return: the number of shares updated.
+        """
+        return self._update_status(status=Status.ACCEPTED,
+                                   last_modified_user=last_modified_user,
+                                   batch_size=batch_size,
+                                   response_dttm=datetime.utcnow(),
+                                   **kwargs)
+
+    def decline(self, last_modified_user=None, batch_size=None, **kwargs):
+        """Declines all the shares in the queryset.
+
+        :param last_modified_user: the user declining the shares.
+        :param batch_size: if provided, the shares are updated in batches of
+            this many shares.
+        :param kwargs: additional fields to update on the shares.
+        :return: the number of shares updated.
+        """
+        return self._update_status(status=Status.DECLINED,
+                                   last_modified_user=last_modified_user,
+                                   batch_size=batch_size,
+                                   response_dttm=datetime.utcnow(),
+                                   **kwargs)
+
+    def inactivate(self, last_modified_user=None, batch_size=None, **kwargs):
+        """Inactivates all the shares in the queryset.
+
+        :param last_modified_user: the user inactivating the shares.
+        :param batch_size: if provided, the shares are updated in batches of
+            this many shares.
+        :param kwargs: additional fields to update on the shares.
+        :return: the number of shares updated.
+        """
+        return self._update_status(status=Status.INACTIVE,
+                                   last_modified_user=last_modified_user,
+                                   batch_size=batch_size,
+                                   response_dttm=datetime.utcnow(),
+                                   **kwargs)
+
+    def delete_safe(self, last_modified_user=None, batch_size=None, **kwargs):
+        """Sets the status to DELETED for all the shares in the queryset.
+
+        :param last_modified_user: the user deleting the shares.
+        :param batch_size: if provided, the shares are updated in batches of
+            this many shares.
+        :param kwargs: additional fields to update on the shares.
+        :return: the number of shares updated.
+        """
+        return self._update_status(status=Status.DELETED,
+                                   last_modified_user=last_modified_user,
+                                   batch_size=batch_size,
+                                   **kwargs)
+
+    def _update_status(self, status, last_modified_user=None,
+                       batch_size=None, **kwargs):
+        """Updates the status of all the shares in the queryset.
+
+        :return: the number of shares updated.
+        """
+        kwargs['status'] = status
+
+        if last_modified_user is not None:
+            kwargs['last_modified_user'] = last_modified_user
+
+        if 'last_modified_dttm' in self.model._meta.get_all_field_names():
+            kwargs['last_modified_dttm'] = datetime.utcnow()
+
+        with record_share_changes(using=self.db) as changes:
+            if changes is not None:
+                # The current status counts are needed to update the share
+                # counter.
+                changes.extend(
+                    ((values['content_type_id'], values['object_id']),
+                     values['status'], status, values['num_shares'])
+                    for values in self.order_by().values(
+                        'content_type_id', 'object_id', 'status'
+                    ).annotate(num_shares=Count('id'))
+                )
+
+            if not batch_size:
+                return self.update(**kwargs)
+
+            num_updated = 0
+            share_ids = list(self.values_list('id', flat=True))
+
+            for share_ids_chunk in chunks(share_ids, batch_size):
+                queryset = self.model._default_manager.db_manager(
+                    self.db
+                ).filter(id__in=share_ids_chunk)
+
+                if self._shared_object_keys is not None:
+                    queryset = queryset.for_shared_object_keys(
+                        keys=self._shared_object_keys,
+                        user_ids=self._share_user_ids
+                    )
+
+                num_updated += queryset.update(**kwargs)
+
+            return num_updated
+
+
+class SharedObjectQuerySet(QuerySet):
+
+    """QuerySet for the object being shared."""
+
+    def with_user_share(self, user, fields=('status', 'id', 'token')):
+        """Annotates each object with fields from the user's share to the
+        object so a list of objects and the user's shares resolve in a single
+        query.  The fields are added as ``user_share_<field>`` and are None
+        when the user doesn't have a share to the object.
+
+        >> objs = SomeObject.objects.with_user_share(request.user)
+        >> objs[0].user_share_status
+        'ACCEPTED'
+
+        To get the share objects themselves, use
+        ``ShareManager.prefetch_for_user`` instead.
+
+        :param user: the user the shares are for.
+        :param fields: the share fields to annotate.
+        """
+        queryset = self
+
+        for field in fields:
+            sql, params = get_user_share_subquery(model=self.model,
+                                                  for_user=user,
+                                                  select=field,
+                                                  using=self.db)
+            queryset = queryset.extra(
+                select={'user_share_{0}'.format(field): sql},
+                select_params=params
+            )
+
+        return queryset
@@ -0,0 +1,56 @@
+from __future__ import unicode_literals
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from ...compat import get_models
+from ...models import AbstractShare
+
+
+class Command(BaseCommand):
+    help = ('Lowercases the emails of existing shares so they match the '
+            'emails saved by AbstractShare.save_prep and can be looked up '
+            'with ShareManager.get_by_email.')
+    option_list = BaseCommand.option_list + (
+        make_option('--dry-run',
+                    action='store_true',
+                    dest='dry_run',
+                    default=False,
+                    help='Report the number of shares that would be updated '
+                         'without updating them.'),
+    )
+
+    def handle(self, *args, **options):
+        num_updated = 0
+
+        for share_model in get_models():
+            if (not issubclass(share_model, AbstractShare) or
+                    share_model._meta.proxy):
+                continue
+
+            # share ids keyed by the lowercased email {email: [id, ...]}
+            share_ids_by_email = {}
+            values = (share_model._default_manager
+                                 .exclude(email__isnull=True)
+                                 .exclude(email='')
+                                 .values_list('id', 'email'))
+
+            for share_id, email in values.iterator():
+                if email != email.lower():
+                    share_ids_by_email.setdefault(email.lower(), []).append(
+                        share_id
+                    )
+
+            for email, share_ids in share_ids_by_email.items():
+                if not options.get('dry_run'):
+                    (share_model._default_manager
+                                .filter(id__in=share_ids)
+                                .update(email=email))
+
+                num_updated += len(share_ids)
+
+        self.stdout.write('{0} {1} share email(s).'.format(
+            'Would update' if options.get('dry_run') else 'Updated',
+            num_updated
+        ))
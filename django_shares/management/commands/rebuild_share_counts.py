@@ -0,0 +1,54 @@
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db.models import Count
+
+from ...compat import get_models
+from ...constants import Status
+from ...counters import get_share_counter
+from ...models import AbstractShare
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds the share counts by status for all shared objects from '
+            'the shares in the database.')
+
+    def handle(self, *args, **options):
+        counter = get_share_counter()
+
+        if counter is None:
+            raise CommandError('Share counting is not enabled.  Set the '
+                               'SHARES_COUNTER_BACKEND setting.')
+
+        counter.clear()
+        num_objects = 0
+
+        for share_model in get_models():
+            if not issubclass(share_model, AbstractShare):
+                continue
+
+            counts_by_key = {}
+            share_counts = (share_model._default_manager
+                                       .order_by()
+                                       .values('content_type_id',
+                                               'object_id',
+                                               'status')
+                                       .annotate(num_shares=Count('id')))
+
+            for values in share_counts.iterator():
+                key = (values['content_type_id'], values['object_id'])
+
+                if key not in counts_by_key:
+                    counts_by_key[key] = dict((status, 0)
+                                              for status in Status.get_keys())
+
+                counts_by_key[key][values['status']] = values['num_shares']
+
+            for key, counts in counts_by_key.items():
+                counter.set_counts(key, counts)
+
+            num_objects += len(counts_by_key)
+
+        self.stdout.write('Rebuilt share counts for {0} shared '
+                          'objects.'.format(num_objects))
@@ -0,0 +1,112 @@
+from __future__ import unicode_literals
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from django.db import connections
+
+from ...compat import get_models
+from ...models import AbstractShare
+
+
+# Field names for the indexes the share lookups rely on.  An existing index
+# covers a recommended index when the recommended columns are a prefix of the
+# existing index's columns.
+RECOMMENDED_SHARE_INDEXES = (
+    ('for_user', 'status'),
+    ('content_type', 'object_id', 'status'),
+    ('token',),
+    ('email',),
+)
+
+
+class Command(BaseCommand):
+    help = ('Reports the recommended indexes that are missing from the '
+            'database tables of the concrete share models.')
+    option_list = BaseCommand.option_list + (
+        make_option('--database',
+                    action='store',
+                    dest='database',
+                    default=DEFAULT_DB_ALIAS,
+                    help='The database to inspect. Defaults to the '
+                         '"default" database.'),
+    )
+
+    def handle(self, *args, **options):
+        connection = connections[options.get('database')]
+        num_missing = 0
+
+        for share_model in get_models():
+            if (not issubclass(share_model, AbstractShare) or
+                    share_model._meta.proxy):
+                continue
+
+            missing = self.get_missing_indexes(connection, share_model)
+            num_missing += len(missing)
+            self.stdout.write('{0} ({1}):'.format(
+                share_model._meta.object_name,
+                share_model._meta.db_table
+            ))
+
+            if not missing:
+                self.stdout.write('  All recommended indexes exist.')
+                continue
+
+            for field_names in missing:
+                self.stdout.write('  Missing index on ({0})'.format(
+                    ', '.join(field_names)
+                ))
+
+        self.stdout.write('{0} missing index(es) found.'.format(num_missing))
+
+    def get_missing_indexes(self, connection, share_model):
+        """Gets the recommended indexes that don't exist for the share model's
+        table.
+
+        :param connection: the database connection to inspect.
+        :param share_model: the concrete share model class.
+        :return: list of field name tuples for the missing indexes.
+        """
+        existing = self.get_indexed_columns(connection,
+                                            share_model._meta.db_table)
+        missing = []
+
+        for field_names in RECOMMENDED_SHARE_INDEXES:
+            columns = tuple(share_model._meta.get_field(field_name).column
+                            for field_name in field_names)
+
+            if not any(index_columns[:len(columns)] == columns
+                       for index_columns in existing):
+                missing.append(field_names)
+
+        return missing
+
+    def get_indexed_columns(self, connection, table_name):
+        """Gets the column tuples for each index and unique constraint on the
+        table.
+
+        :param connection: the database connection to inspect.
+        :param table_name: the name of the table.
+        """
+        introspection = connection.introspection
+        cursor = connection.cursor()
+        constraints = None
+
+        # django < 1.7 doesn't have get_constraints.
+        if hasattr(introspection, 'get_constraints'):
+            try:
+                constraints = introspection.get_constraints(cursor,
+                                                            table_name)
+            except NotImplementedError:
+                pass
+
+        if constraints is None:
+            # Only single column indexes can be introspected.
+            indexes = introspection.get_indexes(cursor, table_name)
+            return [(column,) for column in indexes]
+
+        return [tuple(constraint['columns'])
+                for constraint in constraints.values()
+                if (constraint['index'] or constraint['unique'] or
+                    constraint['primary_key']) and constraint['columns']]
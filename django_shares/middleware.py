@@ -0,0 +1,22 @@
+from __future__ import unicode_literals
+
+from .cache import activate_request_cache
+from .cache import deactivate_request_cache
+
+
+class ShareCacheMiddleware(object):
+    """Middleware that activates a share cache for the life of a request so
+    an object's shares are loaded at most once per request.
+
+    The cache is available on the request as ``request.share_cache``.
+    """
+
+    def process_request(self, request):
+        request.share_cache = activate_request_cache()
+
+    def process_response(self, request, response):
+        deactivate_request_cache()
+        return response
+
+    def process_exception(self, request, exception):
+        deactivate_request_cache()
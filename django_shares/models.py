@@ -6,14 +6,22 @@ from django.contrib.auth import get_user_model
 from django.contrib.contenttypes import generic
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
+from django.db.models.signals import class_prepared
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext as _
 from django_core.db.models import AbstractTokenModel
 from django_core.db.models.mixins.base import AbstractBaseModel
 from django_core.utils.list_utils import make_obj_list
 
+from .cache import invalidate_shares
+from .cache import invalidate_user_shares
 from .constants import Status
+from .counters import record_share_changes
 from .db.models import ShareManager
+from .db.models.mixins import update_share_status
 from django.conf import settings
 
 
@@ -22,11 +30,14 @@ class AbstractShare(AbstractTokenModel, AbstractBaseModel):
     """Abstract Base share object represents basic shared information for a
     specific user sharing an object.
 
-    It's highly recommended that the implementing class puts a index on one of
-    the two options:
+    Composite indexes are included for the common lookups:
 
-    * object_id
-    * (object_id, content_type)
+    * (for_user, status): a user's shares by status
+    * (content_type, object_id, status): an object's shares by status
+
+    The implementing class should extend ``AbstractShare.Meta`` to keep these
+    indexes.  Run the ``share_index_report`` management command to check the
+    indexes on the concrete share tables.
 
     Fields:
     * for_user: the user the object is shared with. This is optional since the
@@ -66,6 +77,8 @@ class AbstractShare(AbstractTokenModel, AbstractBaseModel):
 
     class Meta:
         abstract = True
+        index_together = [('for_user', 'status'),
+                          ('content_type', 'object_id', 'status')]
 
     @classmethod
     def save_prep(cls, instance_or_instances):
@@ -76,6 +89,11 @@ class AbstractShare(AbstractTokenModel, AbstractBaseModel):
 
         for instance in instances:
 
+            if instance.email:
+                # Emails are stored lowercase so they can be looked up with
+                # the email index instead of a case-insensitive match.
+                instance.email = instance.email.lower()
+
             if not instance.is_pending() and not instance.response_dttm:
                 instance.response_dttm = datetime.utcnow()
 
@@ -99,43 +117,55 @@ class AbstractShare(AbstractTokenModel, AbstractBaseModel):
     def is_deleted(self):
         return self.status == Status.DELETED
 
-    def accept(self, **kwargs):
+    def accept(self, expected_status=None, **kwargs):
         """Accept a share by updating the status to accepted.
 
+        :param expected_status: if provided, the share is only accepted if its
+            status in the database is still this status.  This prevents
+            concurrent responses to a share from overwriting each other.
         :param kwargs: additional fields that needs to be updated when the
             field is accepted.
+        :return: boolean indicating if the share was updated.
         """
-        self.status = Status.ACCEPTED
-        self.response_dttm = datetime.utcnow()
-
-        for attr, value in kwargs.items():
-            setattr(self, attr, value)
-
-        return self.save()
+        return self._update_status(status=Status.ACCEPTED,
+                                   expected_status=expected_status,
+                                   response_dttm=datetime.utcnow(),
+                                   **kwargs)
 
-    def decline(self, **kwargs):
-        """Accept a share by updating the status to accepted.
+    def decline(self, expected_status=None, **kwargs):
+        """Decline a share by updating the status to declined.
 
+        :param expected_status: if provided, the share is only declined if its
+            status in the database is still this status.  This prevents
+            concurrent responses to a share from overwriting each other.
         :param kwargs: additional fields that needs to be updated when the
-            field is accepted.
+            field is declined.
+        :return: boolean indicating if the share was updated.
         """
-        self.status = Status.DECLINED
-        self.response_dttm = datetime.utcnow()
-
-        for attr, value in kwargs.items():
-            setattr(self, attr, value)
-
-        return self.save()
+        return self._update_status(status=Status.DECLINED,
+                                   expected_status=expected_status,
+                                   response_dttm=datetime.utcnow(),
+                                   **kwargs)
 
-    def inactivate(self, **kwargs):
-        """Inactivate a share."""
-        self.status = Status.INACTIVE
-        self.response_dttm = datetime.utcnow()
+    def inactivate(self, expected_status=None, **kwargs):
+        """Inactivate a share.
 
-        for attr, value in kwargs.items():
-            setattr(self, attr, value)
-
-        return self.save()
+        :param expected_status: if provided, the share is only inactivated if
+            its status in the database is still this status.
+        :return: boolean indicating if the share was updated.
+        """
+        return self._update_status(status=Status.INACTIVE,
+                                   expected_status=expected_status,
+                                   response_dttm=datetime.utcnow(),
+                                   **kwargs)
+
+    def _update_status(self, status, expected_status=None, **kwargs):
+        """Updates the status of the share.  See
+        ``django_shares.db.models.mixins.update_share_status``.
+        """
+        return update_share_status(self, status=status,
+                                   expected_status=expected_status,
+                                   **kwargs)
 
     def copy(self, exclude_fields=None, **override_fields):
         """Returns an unsaved copy of the object minus any fields included in
@@ -202,15 +232,67 @@ class AbstractShare(AbstractTokenModel, AbstractBaseModel):
         return self.email
 
 
+def invalidate_cached_shares(sender, instance, **kwargs):
+    """Invalidates the cached shares for the shared object when a share is
+    saved or deleted.
+    """
+    invalidate_shares(keys=[(instance.content_type_id, instance.object_id)])
+
+    if instance.for_user_id:
+        invalidate_user_shares(user_ids=[instance.for_user_id])
+
+
+def decrement_share_counts(sender, instance, using, **kwargs):
+    """Removes hard deleted shares from the share counts."""
+    with record_share_changes(using=using) as changes:
+        if changes is not None:
+            changes.append(((instance.content_type_id, instance.object_id),
+                            instance.status, None, 1))
+
+
+@receiver(class_prepared)
+def connect_share_signals(sender, **kwargs):
+    """Connects the share signal receivers to each share model as it's
+    prepared.  The receivers are connected per share model instead of to
+    every model so saves and deletes of other models don't run them (and
+    keep django's fast deletes).
+    """
+    if issubclass(sender, AbstractShare) and not sender._meta.abstract:
+        post_save.connect(invalidate_cached_shares, sender=sender)
+        post_delete.connect(invalidate_cached_shares, sender=sender)
+        post_delete.connect(decrement_share_counts, sender=sender)
+
+
+class AbstractShareCount(models.Model):
+    """Abstract denormalized count of shares by status for a shared object.
+    To keep share counts in the database, extend this model and set the
+    ``SHARES_COUNTER_BACKEND`` and ``SHARES_COUNTER_MODEL`` settings.  See
+    ``django_shares.counters``.
+
+    Fields:
+    * content_type: the content type of the generic shared object
+    * object_id: the object id of the shared object
+    * status: status of the shares being counted
+    * count: number of shares for the shared object with the status
+    """
+    content_type = models.ForeignKey(ContentType, related_name='+')
+    object_id = models.PositiveIntegerField()
+    status = models.CharField(max_length=25, choices=Status.CHOICES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+        unique_together = ('content_type', 'object_id', 'status')
+
+
 @python_2_unicode_compatible
 class Share(AbstractShare):
     """The implementation for a shared object."""
 
-    class Meta:
+    class Meta(AbstractShare.Meta):
         ordering = ('-id',)
         # Make sure you can only have 1 share per user per shared_object
         unique_together = ('content_type', 'object_id', 'for_user',)
-        index_together = [('content_type', 'object_id')]
 
     def __str__(self):
         return str(self.id)
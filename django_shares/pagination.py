@@ -0,0 +1,138 @@
+"""
+Keyset (cursor) pagination for shares.
+
+Pages are found by filtering on the position of the last share on the
+previous page instead of an OFFSET, so every page costs the same as the first
+one.  The position is passed around as an opaque signed cursor.
+"""
+from __future__ import unicode_literals
+
+from django.core import signing
+from django.db.models.query_utils import Q
+from django.utils.dateparse import parse_datetime
+
+
+CURSOR_SALT = 'django_shares.pagination'
+
+# The fields the shares are ordered by for each supported ordering.  The id
+# breaks ties so the ordering is always unique.
+KEYSET_ORDERING_FIELDS = {
+    '-id': ('id',),
+    'id': ('id',),
+    '-last_sent': ('last_sent', 'id'),
+    'last_sent': ('last_sent', 'id'),
+}
+
+
+class KeysetPage(object):
+    """A page of shares from keyset pagination.
+
+    :param object_list: the shares on the page.
+    :param next_cursor: the cursor for the next page or None if this is the
+        last page.
+    """
+
+    def __init__(self, object_list, next_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def encode_cursor(ordering, share):
+    """Gets the opaque cursor for the position of a share in an ordering.
+
+    :param ordering: one of the ``KEYSET_ORDERING_FIELDS`` orderings.
+    :param share: the share to get the position of.
+    """
+    values = []
+
+    for field_name in KEYSET_ORDERING_FIELDS[ordering]:
+        value = getattr(share, field_name)
+        values.append(value.isoformat() if hasattr(value, 'isoformat')
+                      else value)
+
+    return signing.dumps([ordering] + values, salt=CURSOR_SALT)
+
+
+def decode_cursor(ordering, cursor):
+    """Gets the values of the ordering fields from a cursor.
+
+    :param ordering: one of the ``KEYSET_ORDERING_FIELDS`` orderings.
+    :param cursor: a cursor from ``encode_cursor``.
+    :raises ValueError: if the cursor is invalid or is for a different
+        ordering.
+    """
+    try:
+        values = signing.loads(cursor, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        raise ValueError('Invalid cursor.')
+
+    field_names = KEYSET_ORDERING_FIELDS[ordering]
+
+    if (not isinstance(values, list) or
+            len(values) != len(field_names) + 1 or values[0] != ordering):
+        raise ValueError('Invalid cursor.')
+
+    values = values[1:]
+
+    if field_names[0] == 'last_sent':
+        values[0] = parse_datetime(values[0])
+
+    return values
+
+
+def get_keyset_page(queryset, cursor=None, page_size=25, ordering='-id'):
+    """Gets a page of shares from a queryset with keyset pagination.
+
+    :param queryset: the shares to paginate.
+    :param cursor: the cursor from the previous page.  If None, the first page
+        is returned.
+    :param page_size: the number of shares on the page.
+    :param ordering: one of the ``KEYSET_ORDERING_FIELDS`` orderings.  The
+        database needs an index on the ordering fields for deep pages to be
+        as cheap as the first page.
+    :return: KeysetPage
+    """
+    if ordering not in KEYSET_ORDERING_FIELDS:
+        raise ValueError('Unsupported ordering "{0}".'.format(ordering))
+
+    field_names = KEYSET_ORDERING_FIELDS[ordering]
+    descending = ordering.startswith('-')
+    lookup = 'lt' if descending else 'gt'
+
+    if cursor is not None:
+        values = decode_cursor(ordering=ordering, cursor=cursor)
+
+        if len(field_names) == 1:
+            queryset = queryset.filter(
+                **{'{0}__{1}'.format(field_names[0], lookup): values[0]}
+            )
+        else:
+            queryset = queryset.filter(
+                Q(**{'{0}__{1}'.format(field_names[0], lookup): values[0]}) |
+                Q(**{field_names[0]: values[0],
+                     '{0}__{1}'.format(field_names[1], lookup): values[1]})
+            )
+
+    order_by = [('-' if descending else '') + field_name
+                for field_name in field_names]
+    # One extra share is fetched to tell if there's a next page.
+    shares = list(queryset.order_by(*order_by)[:page_size + 1])
+    next_cursor = None
+
+    if len(shares) > page_size:
+        shares = shares[:page_size]
+        next_cursor = encode_cursor(ordering=ordering, share=shares[-1])
+
+    return KeysetPage(object_list=shares, next_cursor=next_cursor)
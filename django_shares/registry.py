@@ -0,0 +1,140 @@
+"""
+Registry of shared object models.
+
+* content type ids: the content type id of a model is resolved once per
+    process and read from memory afterwards.
+* share models: each shared object model is mapped to the share model of its
+    "shares" generic relation and each share model to its shared object
+    models.
+
+Nothing is looked up until it's first used so the database isn't touched
+when the app is loaded.
+"""
+from __future__ import unicode_literals
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import class_prepared
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .compat import get_models
+from .compat import post_migrate
+
+
+_content_type_ids = {}
+_share_models = {}
+_shared_object_models = {}
+
+
+def get_content_type_id(model_or_obj):
+    """Gets the content type id for a model class or model instance.
+
+    :param model_or_obj: the model class or an instance of the model.
+    """
+    model = (model_or_obj if isinstance(model_or_obj, type)
+             else model_or_obj.__class__)
+
+    try:
+        return _content_type_ids[model]
+    except KeyError:
+        content_type_id = ContentType.objects.get_for_model(model).id
+        _content_type_ids[model] = content_type_id
+        return content_type_id
+
+
+def get_content_type_ids(models):
+    """Gets a dict of content type ids keyed by model.  Only the models that
+    aren't registered yet are looked up and they're looked up together.
+
+    :param models: iterable of model classes.
+    :return: dict of {model: content_type_id}
+    """
+    models = set(models)
+    missing = [model for model in models if model not in _content_type_ids]
+
+    if missing:
+        for model, content_type in ContentType.objects.get_for_models(
+                *missing).items():
+            _content_type_ids[model] = content_type.id
+
+    return dict((model, _content_type_ids[model]) for model in models)
+
+
+def get_share_model(shared_object_model):
+    """Gets the share model for a shared object model from the model's
+    "shares" generic relation or None if the model doesn't have a "shares"
+    generic relation.
+
+    :param shared_object_model: the shared object model class.
+    """
+    try:
+        return _share_models[shared_object_model]
+    except KeyError:
+        pass
+
+    share_model = _get_shares_field_model(shared_object_model)
+
+    if share_model is not None:
+        register_share_model(shared_object_model, share_model)
+
+    return share_model
+
+
+def get_shared_object_models(share_model):
+    """Gets the installed shared object models that are shared with a share
+    model.
+
+    :param share_model: the share model class.
+    :return: list of shared object model classes.
+    """
+    for model in get_models():
+        if model not in _share_models and hasattr(model, 'get_share_class'):
+            get_share_model(model)
+
+    return list(_shared_object_models.get(share_model, ()))
+
+
+def register_share_model(shared_object_model, share_model):
+    """Registers the share model for a shared object model.
+
+    :param shared_object_model: the shared object model class.
+    :param share_model: the share model class.
+    """
+    _share_models[shared_object_model] = share_model
+    _shared_object_models.setdefault(share_model, set()).add(
+        shared_object_model
+    )
+
+
+def clear_content_type_ids():
+    """Removes all the content type ids from the registry."""
+    _content_type_ids.clear()
+
+
+def _get_shares_field_model(model):
+    """Gets the model of the "shares" generic relation on a model or None if
+    the relation doesn't exist or its model isn't loaded yet.
+    """
+    for field in getattr(model._meta, 'virtual_fields', ()):
+        if field.name == 'shares' and isinstance(field.rel.to, type):
+            return field.rel.to
+
+    return None
+
+
+@receiver(class_prepared)
+def register_prepared_share_model(sender, **kwargs):
+    """Registers the share model of shared object models as they're prepared.
+    Relations to models that aren't loaded yet are resolved when first used.
+    """
+    if not sender._meta.abstract and hasattr(sender, 'get_share_class'):
+        get_share_model(sender)
+
+
+@receiver(post_migrate)
+@receiver(post_delete, sender=ContentType)
+def clear_stale_content_type_ids(sender, **kwargs):
+    """Content type ids can't be trusted once content types are deleted or
+    recreated (i.e. when the database is flushed) so the registry is cleared.
+    """
+    clear_content_type_ids()
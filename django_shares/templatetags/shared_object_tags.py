@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from django import template
 
+from ..utils import get_share_for_user as _get_share_for_user
+
 register = template.Library()
 
 
@@ -14,8 +16,19 @@ def get_share_for_user(shares, user):
     if not shares:
         return None
 
-    for share in shares:
-        if share.for_user_id == user.id:
-            return share
+    return _get_share_for_user(shares=shares, user=user)
+
+
+@register.filter
+def get_object_share_for_user(obj, user):
+    """Gets the share to a shared object for a specific user.  When the
+    request share cache is active, this reads from the shares already loaded
+    for the object during the request.
+
+    :param obj: the shared object
+    :param user: the user the share is for
+    """
+    if obj is None:
+        return None
 
-    return None
+    return obj.shares.get_for_user(user)
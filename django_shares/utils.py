@@ -1,5 +1,121 @@
 from __future__ import unicode_literals
 
+from itertools import islice
+
+
+class ShareList(list):
+    """List of shares that can look up a share by the user it's for without
+    scanning the list each time.
+    """
+    _shares_by_user_id = None
+
+    def get_for_user_id(self, user_id):
+        """Gets the share for a user id or None if the user doesn't have a
+        share in the list.
+        """
+        if self._shares_by_user_id is None:
+            self._shares_by_user_id = dict((share.for_user_id, share)
+                                           for share in self
+                                           if share.for_user_id)
+
+        return self._shares_by_user_id.get(user_id)
+
+
+class LazyShareList(object):
+    """List of shares that isn't loaded until it's first accessed.
+
+    :param loader: callable that returns the list of shares.  It's called at
+        most once.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._shares = None
+
+    @property
+    def is_loaded(self):
+        return self._shares is not None
+
+    def _get_shares(self):
+        if self._shares is None:
+            self._shares = self._loader()
+
+        return self._shares
+
+    def __len__(self):
+        return len(self._get_shares())
+
+    def __bool__(self):
+        return len(self._get_shares()) > 0
+
+    __nonzero__ = __bool__
+
+    def __iter__(self):
+        return iter(self._get_shares())
+
+    def __getitem__(self, index):
+        return self._get_shares()[index]
+
+    def __contains__(self, share):
+        return share in self._get_shares()
+
+    def get_for_user_id(self, user_id):
+        """Gets the share for a user id or None if the user doesn't have a
+        share in the list.
+        """
+        return get_share_for_user_id(self._get_shares(), user_id)
+
+
+class LazyShares(object):
+    """Shares from a queryset that aren't loaded until they're iterated over.
+    The number of shares is known up front so checking the length or
+    truthiness doesn't make a query, and slicing only loads the shares in the
+    slice.  This works with django's Paginator.
+
+    :param queryset: the queryset of the shares.
+    :param count: the number of shares in the queryset.
+    """
+
+    def __init__(self, queryset, count):
+        self.queryset = queryset
+        self._count = count
+        self._shares = None
+
+    def count(self):
+        return self._count
+
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+    __nonzero__ = __bool__
+
+    def __iter__(self):
+        if self._shares is None:
+            self._shares = ShareList(self.queryset) if self._count else []
+
+        return iter(self._shares)
+
+    def __getitem__(self, index):
+        if self._shares is not None:
+            return self._shares[index]
+
+        return self.queryset[index]
+
+    def get_for_user_id(self, user_id):
+        """Gets the share for a user id or None if the user doesn't have a
+        share in the list.
+        """
+        if not self._count:
+            return None
+
+        if self._shares is None:
+            return self.queryset.filter(for_user_id=user_id).first()
+
+        return self._shares.get_for_user_id(user_id)
+
 
 def sort_shares_by_status(shares):
     """Sorts shares by status and returns a dict key'd by status type.
@@ -21,7 +137,7 @@ def sort_shares_by_status(shares):
         if share.status in share_by_status:
             share_by_status[share.status].append(share)
         else:
-            share_by_status[share.status] = [share]
+            share_by_status[share.status] = ShareList([share])
 
     return share_by_status
 
@@ -34,8 +150,40 @@ def get_share_for_user(shares, user):
     :return: the share object for the specified user or return None if not
         found.
     """
+    return get_share_for_user_id(shares=shares, user_id=user.id)
+
+
+def get_share_for_user_id(shares, user_id):
+    """Gets the share object for a specific user id.
+
+    :param shares: iterable of shares
+    :param user_id: id of the user to get share for
+    :return: the share object for the specified user or return None if not
+        found.
+    """
+    if hasattr(shares, 'get_for_user_id'):
+        return shares.get_for_user_id(user_id)
+
     for share in shares:
-        if share.for_user_id == user.id:
+        if share.for_user_id == user_id:
             return share
 
     return None
+
+
+def chunks(iterable, size):
+    """Yields lists of at most ``size`` items from an iterable.  The iterable
+    is consumed lazily so it can be a generator.
+
+    >> list(chunks([1, 2, 3, 4, 5], 2))
+    [[1, 2], [3, 4], [5]]
+    """
+    iterator = iter(iterable)
+
+    while True:
+        chunk = list(islice(iterator, size))
+
+        if not chunk:
+            return
+
+        yield chunk
@@ -1,6 +1,7 @@
 from .auth import ShareRequiredViewMixin
 from .base import SharedObjectViewMixin
 from .common import SharedSingleObjectMixin
+from .pagination import ShareKeysetPaginationViewMixin
 from .shares import SharedObjectSharesViewMixin
 from .urls import SharedObjectRemoveShareDeleteView
 from .urls import SharedObjectShareViewMixin
@@ -1,3 +1,5 @@
+from __future__ import unicode_literals
+
 from django.core.exceptions import PermissionDenied
 
 
@@ -5,12 +7,59 @@ class ShareRequiredViewMixin(object):
     """Share mixin that ensures the authenticated user has a share to the
     object being viewed or get a permission denied.
 
-    This method assumes the following mixin has already been called:
+    If the shared object has already been fetched, this method assumes the
+    following mixin has already been called:
 
         * django_shares.mixins.views.SharedObjectSharesViewMixin
+
+    If this mixin comes before the mixins that fetch the shared object, access
+    is checked with ``ShareManager.has_access`` using the shared object key
+    from ``SharedObjectViewMixin.get_shared_object_key`` so unauthorized
+    requests are rejected without fetching the shared object at all.  This
+    requires ``shared_object_model`` and ``shared_object_pk_url_kwarg`` to be
+    set on the view.  Otherwise the shared object is fetched with
+    ``get_shared_object`` to check the user's share.
+
+    Attributes:
+
+    * share_access_statuses: iterable of share statuses that give access to
+        the shared object.  If None, a share with any status gives access.
     """
+    share_access_statuses = None
+
     def dispatch(self, *args, **kwargs):
-        if not getattr(self, 'shared_object_user_share', None):
+        if not self.has_share_access():
             raise PermissionDenied
 
         return super(ShareRequiredViewMixin, self).dispatch(*args, **kwargs)
+
+    def has_share_access(self):
+        """Boolean indicating if the auth user has access to the shared
+        object.
+        """
+        if getattr(self, 'shared_object', None) is None:
+            key = (self.get_shared_object_key()
+                   if hasattr(self, 'get_shared_object_key') else None)
+
+            if key is not None:
+                share_model = self.get_shared_object_model().get_share_class()
+                return share_model.objects.has_access(
+                    user=self.request.user,
+                    content_type_id=key[0],
+                    object_id=key[1],
+                    statuses=self.share_access_statuses
+                )
+
+            # The shared object can't be identified from the url so it has
+            # to be fetched to check the user's share.
+            user_share = self.get_shared_object().shares.get_for_user(
+                self.request.user
+            )
+        else:
+            user_share = getattr(self, 'shared_object_user_share', None)
+
+        if not user_share:
+            return False
+
+        return (self.share_access_statuses is None or
+                user_share.status in self.share_access_statuses)
@@ -1,5 +1,7 @@
 from __future__ import unicode_literals
 
+from ..registry import get_content_type_id
+
 
 class SharedObjectViewMixin(object):
     """For use when you have a shared object in context."""
@@ -25,3 +27,38 @@ class SharedObjectViewMixin(object):
         Defaults to self.object.
         """
         return self.shared_object or self.get_object()
+
+    def get_shared_object_model(self):
+        """Gets the model of the shared object."""
+        if self.shared_object is not None:
+            return self.shared_object.__class__
+
+        return self.shared_object_model
+
+    def get_shared_object_key(self):
+        """Gets the (content_type_id, object_id) of the shared object without
+        fetching it or None if it can't be determined.  The key is taken from
+        the shared object if it's already been fetched.  Otherwise it's only
+        taken from the url when both ``shared_object_model`` and
+        ``shared_object_pk_url_kwarg`` are set since ``get_shared_object``
+        can be overridden to return an object other than the one in the url.
+        """
+        if self.shared_object is not None:
+            if not hasattr(self.shared_object, 'get_share_class'):
+                return None
+
+            return (get_content_type_id(self.shared_object),
+                    self.shared_object.pk)
+
+        model = self.shared_object_model
+
+        if (model is None or not self.shared_object_pk_url_kwarg or
+                not hasattr(model, 'get_share_class')):
+            return None
+
+        try:
+            object_id = int(self.kwargs[self.shared_object_pk_url_kwarg])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+        return (get_content_type_id(model), object_id)
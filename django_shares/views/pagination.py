@@ -0,0 +1,49 @@
+from __future__ import unicode_literals
+
+from django.http import Http404
+
+
+class ShareKeysetPaginationViewMixin(object):
+    """Paginates a list view of shares with keyset pagination instead of
+    OFFSET pagination.  Use with django.views.generic.list.MultipleObjectMixin
+    views (i.e. ListView) whose queryset is a ShareQuerySet.
+
+    The cursor for the page is read from the ``cursor_kwarg`` query string
+    parameter.  ``page_obj`` in the context is a
+    django_shares.pagination.KeysetPage and ``next_cursor`` is the cursor for
+    the next page or None if it's the last page.
+
+    Attributes:
+
+    * cursor_kwarg: the query string parameter the cursor is read from.
+    * keyset_ordering: the ordering of the shares.  One of "-id", "id",
+        "-last_sent" or "last_sent".
+    """
+    cursor_kwarg = 'cursor'
+    keyset_ordering = '-id'
+
+    def get_context_data(self, **kwargs):
+        context = super(ShareKeysetPaginationViewMixin,
+                        self).get_context_data(**kwargs)
+        page = context.get('page_obj')
+        context['next_cursor'] = getattr(page, 'next_cursor', None)
+        return context
+
+    def get_cursor(self):
+        """Gets the cursor for the page being viewed or None for the first
+        page.
+        """
+        return self.request.GET.get(self.cursor_kwarg) or None
+
+    def paginate_queryset(self, queryset, page_size):
+        cursor = self.get_cursor()
+
+        try:
+            page = queryset.keyset_page(cursor=cursor,
+                                        page_size=page_size,
+                                        ordering=self.keyset_ordering)
+        except ValueError:
+            raise Http404('Invalid page cursor.')
+
+        is_paginated = page.has_next() or cursor is not None
+        return (None, page, page.object_list, is_paginated)
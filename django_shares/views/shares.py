@@ -1,6 +1,11 @@
 from __future__ import unicode_literals
 
+from functools import partial
+
 from ..constants import Status
+from ..utils import LazyShareList
+from ..utils import LazyShares
+from ..utils import ShareList
 from ..utils import sort_shares_by_status
 
 
@@ -13,10 +18,7 @@ class SharedObjectUserShareViewMixin(object):
 
     def dispatch(self, *args, **kwargs):
         if self.request.user.is_authenticated():
-            user_share = self.get_shared_object().shares.get_for_user(
-                self.request.user
-            )
-            self.shared_object_user_share = user_share
+            self.set_shared_object_user_share()
 
         return super(SharedObjectUserShareViewMixin,
                      self).dispatch(*args, **kwargs)
@@ -27,12 +29,37 @@ class SharedObjectUserShareViewMixin(object):
         context['shared_object_user_share'] = self.shared_object_user_share
         return context
 
+    def get_shared_object_user_share(self):
+        """Gets the auth user's share for the shared object."""
+        return self.get_shared_object().shares.get_for_user(self.request.user)
+
+    def set_shared_object_user_share(self):
+        """Sets the auth user's share for the shared object on the view."""
+        self.shared_object_user_share = self.get_shared_object_user_share()
+
 
 class SharedObjectSharesViewMixin(SharedObjectUserShareViewMixin):
     """View mixin for a shared object.  The shared object is assumed to be
     the object returned from `get_object` call from anything that subclasses
     django.views.generic.detail.SingleObjectMixin
+
+    Attributes:
+
+    * aggregate_shares: boolean indicating if only the share counts by status
+        should be loaded up front.  If True, the count of shares for each
+        status is computed with a single query and the shares for a status
+        are only loaded when they're iterated over or sliced (i.e. for
+        pagination).  Use this for objects with a large number of shares.
+    * eager_shares: boolean indicating if all the shares should be loaded in
+        dispatch instead of when they're first accessed.  All of the sharing
+        is loaded with a single call to ``ShareManager.get_sharing_for_user``
+        so nothing on the view queries afterwards.  Use this when the shares
+        are rendered from an async context where lazy queries aren't allowed.
     """
+    aggregate_shares = False
+    eager_shares = False
+    shared_object_shares = None
+    shared_object_share_counts = None
     shared_object_shares_accepted = None
     shared_object_shares_pending = None
     shared_object_shares_declined = None
@@ -51,10 +78,70 @@ class SharedObjectSharesViewMixin(SharedObjectUserShareViewMixin):
 
         for status in Status.get_keys():
             attr_name = u'shared_object_shares_{0}'.format(status.lower())
-            context[attr_name] = getattr(self, attr_name, []) or []
+            # Don't check the truthiness of the shares since that would load
+            # lazy shares that the template might never use.
+            shares = getattr(self, attr_name, None)
+            context[attr_name] = shares if shares is not None else []
+
+        if self.shared_object_share_counts is not None:
+            context['shared_object_share_counts'] = (
+                self.shared_object_share_counts
+            )
 
         return context
 
+    @property
+    def shared_object_user_share(self):
+        """The auth user's share for the shared object.  When the lists of
+        shares are lazy, the user's share is read from them the first time
+        it's accessed so it doesn't take a query of its own.
+        """
+        loader = self.__dict__.pop('_shared_object_user_share_loader', None)
+
+        if loader is not None:
+            self.__dict__['_shared_object_user_share'] = loader()
+
+        return self.__dict__.get('_shared_object_user_share')
+
+    @shared_object_user_share.setter
+    def shared_object_user_share(self, user_share):
+        self.__dict__.pop('_shared_object_user_share_loader', None)
+        self.__dict__['_shared_object_user_share'] = user_share
+
+    def set_shared_object_user_share(self):
+        shares = self.shared_object_shares
+
+        if (isinstance(shares, LazyShareList) and not shares.is_loaded and
+                not self.aggregate_shares):
+            self.__dict__['_shared_object_user_share_loader'] = partial(
+                shares.get_for_user_id,
+                self.request.user.id
+            )
+            return
+
+        super(SharedObjectSharesViewMixin,
+              self).set_shared_object_user_share()
+
+    def get_shared_object_user_share(self):
+        """Gets the auth user's share from the shares already loaded for the
+        shared object so no additional query is made.  When
+        ``aggregate_shares`` is True, only the user's share is queried so the
+        shares for the object are never all loaded.
+        """
+        if self.aggregate_shares:
+            return self.get_shared_object().shares._get_instance_user_share(
+                self.request.user
+            )
+
+        if (self.shared_object_shares is not None and
+            getattr(self.shared_object_shares, 'is_loaded', True)):
+            return self.shared_object_shares.get_for_user_id(
+                self.request.user.id
+            )
+
+        return super(SharedObjectSharesViewMixin,
+                     self).get_shared_object_user_share()
+
     def set_sharing_for_object(self, obj, attr_prefix=None):
         """Sets the sharing on the view.
 
@@ -62,9 +149,12 @@ class SharedObjectSharesViewMixin(SharedObjectUserShareViewMixin):
         :param attr_prefix: the prefix to append to the attributes.  If None,
             the prefix will default to the class name lower cased.
 
-        The following attributes get set on the view:
+        The following attributes get set on the view.  The lists of shares
+        are lazy and aren't loaded until they're first accessed:
 
         {obj class or attr_prefix}_share = # user share
+        {obj class or attr_prefix}_shares # list of all shares for the shared
+                                          # object
         {obj class or attr_prefix}_shares_accepted # list of accepted shares
                                                    # for the shared object
         {obj class or attr_prefix}_shares_pending # list of pending shares
@@ -72,6 +162,12 @@ class SharedObjectSharesViewMixin(SharedObjectUserShareViewMixin):
         {obj class or attr_prefix}_shares_declined # list of declined shares
                                                    # for the shared object
 
+        If ``aggregate_shares`` is True, the following attribute is also set
+        and the lists of shares are lazy:
+
+        {obj class or attr_prefix}_share_counts # dict of share counts keyed
+                                                # by status
+
         Example:
 
         self == some view
@@ -103,16 +199,71 @@ class SharedObjectSharesViewMixin(SharedObjectUserShareViewMixin):
                     self.shared_object_shares_inactive)
             setattr(self, u'{0}_shares_deleted'.format(attr_prefix),
                     self.shared_object_shares_deleted)
+            setattr(self, u'{0}_shares'.format(attr_prefix),
+                    self.shared_object_shares)
+            setattr(self, u'{0}_share_counts'.format(attr_prefix),
+                    self.shared_object_share_counts)
+            return
+
+        if self.aggregate_shares:
+            self.set_aggregate_sharing_for_object(obj=obj,
+                                                  attr_prefix=attr_prefix)
+            return
+
+        if self.eager_shares:
+            self.set_eager_sharing_for_object(obj=obj, attr_prefix=attr_prefix)
             return
 
-        shares = obj.shares.all().prefetch_related('for_user',
-                                                   'created_user',
-                                                   'shared_object')
+        # The shares aren't loaded until one of the lists is accessed and all
+        # the lists share a single fetch.  This reads through the request
+        # share cache when it's active so the shares for the object are only
+        # loaded once per request.
+        shares = LazyShareList(loader=obj.shares.get_shares_list)
+        shares_by_status = {}
+
+        def get_shares_with_status(status):
+            if not shares_by_status:
+                shares_by_status.update(sort_shares_by_status(shares=shares))
+
+            return shares_by_status.get(status, ShareList())
+
+        setattr(self, u'{0}_shares'.format(attr_prefix), shares)
 
-        shares_by_status = sort_shares_by_status(shares=shares)
+        for status in Status.get_keys():
+            attr_name = u'{0}_shares_{1}'.format(attr_prefix, status.lower())
+            setattr(self,
+                    attr_name,
+                    LazyShareList(loader=partial(get_shares_with_status,
+                                                 status)))
+
+    def set_eager_sharing_for_object(self, obj, attr_prefix):
+        """Loads all the shares and sets the lists of shares for each status
+        on the view.  See ``set_sharing_for_object``.
+        """
+        shares, shares_by_status, user_share = (
+            obj.shares.get_sharing_for_user(self.request.user)
+        )
+        setattr(self, u'{0}_shares'.format(attr_prefix), shares)
+        setattr(self, u'{0}_user_share'.format(attr_prefix), user_share)
 
         for status in Status.get_keys():
             attr_name = u'{0}_shares_{1}'.format(attr_prefix, status.lower())
+            setattr(self, attr_name, shares_by_status.get(status, ShareList()))
+
+    def set_aggregate_sharing_for_object(self, obj, attr_prefix):
+        """Sets the share counts by status on the view and lazy lists of the
+        shares for each status.  See ``set_sharing_for_object``.
+        """
+        share_counts = obj.shares.get_status_counts()
+        setattr(self, u'{0}_share_counts'.format(attr_prefix), share_counts)
+
+        for status in Status.get_keys():
+            attr_name = u'{0}_shares_{1}'.format(attr_prefix, status.lower())
+            queryset = obj.shares.filter(status=status).select_related(
+                'for_user',
+                'created_user'
+            )
             setattr(self,
                     attr_name,
-                    shares_by_status.get(status, []))
+                    LazyShares(queryset=queryset,
+                               count=share_counts.get(status, 0)))
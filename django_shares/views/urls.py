@@ -3,6 +3,7 @@ Module all about url shares based on url keyword arg.
 """
 from __future__ import unicode_literals
 
+from django.http import Http404
 from django.views.generic.edit import DeleteView
 
 from ..forms import SharedObjectRemoveShareForm
@@ -11,14 +12,27 @@ from ..forms import SharedObjectRemoveShareForm
 class SharedObjectUrlShareViewMixin(object):
     """Adds the shared object share from a pk in the url.
 
+    When used with ``SharedObjectViewMixin`` and the shared object key is
+    known (see ``SharedObjectViewMixin.get_shared_object_key``), the share is
+    looked up by its token first with the share's content type and user in a
+    single query and then checked against the key so the shared object
+    doesn't need to be fetched to resolve the share.  Otherwise the share is
+    looked up through the shares of ``get_shared_object``.
+
     This mixin puts the following attributes on the view:
 
     * url_share: the share for the shared object with the token provided by
         the 'token_url_kwarg'.
+
+    Attributes:
+
+    * url_share_use_cache: boolean indicating if the share can be read from
+        the shared share cache when it's enabled.
     """
 
     token_url_kwarg = 'token'
     url_share = None
+    url_share_use_cache = True
 
     def dispatch(self, *args, **kwargs):
         self.url_share = self.get_url_share(**kwargs)
@@ -33,8 +47,30 @@ class SharedObjectUrlShareViewMixin(object):
 
     def get_url_share(self, **kwargs):
         if self.url_share is None:
-            self.url_share = self.get_shared_object().shares.get_by_token_or_404(
-                                        token=kwargs.get(self.token_url_kwarg))
+            token = kwargs.get(self.token_url_kwarg)
+            key = (self.get_shared_object_key()
+                   if hasattr(self, 'get_shared_object_key') else None)
+
+            if key is None:
+                self.url_share = (self.get_shared_object()
+                                      .shares
+                                      .get_by_token_or_404(token=token))
+                return self.url_share
+
+            share_model = self.get_shared_object_model().get_share_class()
+            share = share_model.objects.get_for_token(
+                token=token,
+                use_cache=self.url_share_use_cache
+            )
+
+            if share is None or (share.content_type_id,
+                                 share.object_id) != key:
+                raise Http404
+
+            if getattr(self, 'shared_object', None) is not None:
+                share.shared_object = self.shared_object
+
+            self.url_share = share
 
         return self.url_share
 
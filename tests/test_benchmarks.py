@@ -0,0 +1,130 @@
+"""
+Benchmarks for share queries.  These are skipped unless the
+DJANGO_SHARES_BENCHMARK environment variable is set:
+
+    DJANGO_SHARES_BENCHMARK=1 python manage.py test test_benchmarks
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import time
+from unittest import skipUnless
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import DatabaseError
+from django.db.models import Max
+from django_shares.constants import SharedObjectsQueryStrategy
+from django_shares.constants import Status
+from django_shares.models import Share
+from django_testing.testcases.users import SingleUserTestCase
+from django_testing.user_utils import create_user
+
+from test_models.models import TestSharedObjectModel
+from test_models.models import TestSharedObjectModel2
+
+
+def create_shared_objects(model, num_objs, for_user, created_user):
+    """Bulk creates shared objects, each with a share for a user."""
+    first_id = (model.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+    model.objects.bulk_create([model(id=first_id + i)
+                               for i in range(num_objs)])
+    objs = list(model.objects.filter(id__gte=first_id))
+    content_type = ContentType.objects.get_for_model(model)
+    shares = [Share(for_user=for_user,
+                    created_user=created_user,
+                    last_modified_user=created_user,
+                    content_type=content_type,
+                    object_id=obj.id,
+                    status=Status.ACCEPTED)
+              for obj in objs]
+    Share.save_prep(shares)
+    Share.objects.bulk_create(shares, batch_size=500)
+    return objs
+
+
+def timed(func, *args, **kwargs):
+    """Returns the result and number of seconds it took to call func."""
+    start = time.time()
+    result = func(*args, **kwargs)
+    return result, time.time() - start
+
+
+@skipUnless(os.environ.get('DJANGO_SHARES_BENCHMARK'),
+            'Set DJANGO_SHARES_BENCHMARK to run benchmarks.')
+class SharedObjectsQueryBenchmarks(SingleUserTestCase):
+
+    def test_iter_by_shared_objects_strategies(self):
+        """Compare the query strategies for getting shares for many shared
+        objects at 1k, 10k and 100k objects.
+        """
+        objs = []
+
+        for num_objs in (1000, 10000, 100000):
+            num_new_objs = num_objs - len(objs)
+            # Split the objects across two content types
+            objs.extend(create_shared_objects(
+                model=TestSharedObjectModel,
+                num_objs=num_new_objs // 2,
+                for_user=self.user,
+                created_user=self.user
+            ))
+            objs.extend(create_shared_objects(
+                model=TestSharedObjectModel2,
+                num_objs=num_new_objs - num_new_objs // 2,
+                for_user=self.user,
+                created_user=self.user
+            ))
+
+            for strategy, _ in SharedObjectsQueryStrategy.CHOICES:
+                try:
+                    shares, seconds = timed(
+                        lambda: list(Share.objects.iter_by_shared_objects(
+                            objs=objs,
+                            strategy=strategy
+                        ))
+                    )
+                except DatabaseError as e:
+                    print('{0} objects {1}: failed ({2})'.format(
+                        num_objs, strategy, e))
+                    continue
+
+                self.assertEqual(len(shares), num_objs)
+                print('{0} objects {1}: {2:.3f}s'.format(num_objs, strategy,
+                                                          seconds))
+
+
+@skipUnless(os.environ.get('DJANGO_SHARES_BENCHMARK'),
+            'Set DJANGO_SHARES_BENCHMARK to run benchmarks.')
+class SharedObjectGetForUserBenchmarks(SingleUserTestCase):
+
+    def test_get_for_user(self):
+        """Compare joining through the generic relation with the correlated
+        EXISTS subquery for getting objects shared with a user at 100k
+        shares.
+        """
+        num_objs = 100000
+        objs = create_shared_objects(model=TestSharedObjectModel,
+                                     num_objs=num_objs,
+                                     for_user=self.user,
+                                     created_user=self.user)
+        # Shares for another user so the user's shares have to be searched
+        # for.
+        other_user = create_user()
+        create_shared_objects(model=TestSharedObjectModel2,
+                              num_objs=num_objs,
+                              for_user=other_user,
+                              created_user=self.user)
+        querysets = (
+            ('join', TestSharedObjectModel.objects.filter(
+                shares__for_user=self.user)),
+            ('exists', TestSharedObjectModel.objects.get_for_user(
+                for_user=self.user)),
+        )
+
+        for name, queryset in querysets:
+            object_ids, seconds = timed(
+                lambda: list(queryset.values_list('id', flat=True))
+            )
+            self.assertEqual(len(object_ids), len(objs))
+            print('{0} objects {1}: {2:.3f}s'.format(num_objs, name, seconds))
@@ -4,6 +4,7 @@ from django.contrib.contenttypes import generic
 from django.db import models
 from django_shares.db.models import AbstractSharedObjectModelMixin
 from django_shares.db.models.managers import SharedObjectManager
+from django_shares.models import AbstractShareCount
 
 
 class TestSharedObjectModel(AbstractSharedObjectModelMixin):
@@ -18,3 +19,7 @@ class TestSharedObjectModel2(AbstractSharedObjectModelMixin):
     group = models.CharField(max_length=50, blank=True, null=True)
     shares = generic.GenericRelation('django_shares.Share')
     objects = SharedObjectManager()
+
+
+class TestShareCount(AbstractShareCount):
+    """Test model for share counts."""
@@ -1,7 +1,30 @@
 from __future__ import unicode_literals
 
+from datetime import datetime
+from unittest import skipUnless
+
+from django.core.management import call_command
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.six import StringIO
+from django_shares.cache import activate_request_cache
+from django_shares.cache import deactivate_request_cache
+from django_shares.cache import get_share_cache
+from django_shares.constants import SharedObjectsQueryStrategy
 from django_shares.constants import Status
+from django_shares.counters import get_share_counter
+from django_shares.management.commands import share_index_report
 from django_shares.models import Share
+from django_shares.registry import clear_content_type_ids
+from django_shares.registry import get_content_type_id
+from django_shares.registry import get_content_type_ids
+from django_shares.registry import get_share_model
+from django_shares.registry import get_shared_object_models
 from django_testing.testcases.users import SingleUserTestCase
 from django_testing.user_utils import create_user
 
@@ -80,6 +103,54 @@ class ShareTests(SingleUserTestCase):
         self.assertEqual(len(shares), 1)
         self.assertEqual(shares[0], share)
 
+    def test_get_email_case_insensitive(self):
+        """Test emails are stored lowercase and looked up case-insensitive."""
+        share = Share.objects.create_for_non_user(created_user=self.user,
+                                                  shared_object=self.shared_user,
+                                                  first_name='Jimmy',
+                                                  last_name='Buffet',
+                                                  email='Hello@World.com')
+        self.assertEqual(share.email, 'hello@world.com')
+
+        shares = Share.objects.get_by_email(email='HELLO@world.com')
+        self.assertEqual(list(shares), [share])
+
+    def test_get_email_without_users(self):
+        """Test getting shares by email without matching users' emails."""
+        user = create_user()
+        share = Share.objects.create_for_user(created_user=self.user,
+                                              for_user=user,
+                                              shared_object=self.shared_user)
+        self.assertEqual(list(Share.objects.get_by_email(email=user.email)),
+                         [share])
+
+        with self.assertNumQueries(1):
+            shares = list(Share.objects.get_by_email(email=user.email,
+                                                     include_users=False))
+
+        self.assertEqual(shares, [])
+
+    def test_get_email_none(self):
+        """Test getting shares by an empty email doesn't match anything."""
+        self.assertEqual(list(Share.objects.get_by_email(email=None)), [])
+        test_obj = TestSharedObjectModel.objects.create()
+        self.assertIsNone(test_obj.shares.get_by_email(email=None))
+
+    def test_normalize_share_emails(self):
+        """Test lowercasing the emails of existing shares."""
+        share = Share.objects.create_for_non_user(created_user=self.user,
+                                                  shared_object=self.shared_user,
+                                                  first_name='Jimmy',
+                                                  last_name='Buffet',
+                                                  email='hello@world.com')
+        Share.objects.filter(id=share.id).update(email='Hello@World.com')
+
+        out = StringIO()
+        call_command('normalize_share_emails', stdout=out)
+        self.assertIn('Updated 1 share email(s).', out.getvalue())
+        self.assertEqual(list(Share.objects.get_by_email('hello@world.com')),
+                         [share])
+
     def test_get_by_token(self):
         """Get a share by token."""
         # self.assertEqual(self.car.shares, [])
@@ -282,3 +353,924 @@ class ShareTests(SingleUserTestCase):
         self.assertEqual(obj_1.shares.count(), 1)
         self.assertEqual(obj_2.shares.count(), 1)
         self.assertEqual(obj_3.shares.count(), 1)
+
+    def test_request_cache_loads_shares_once(self):
+        """Test the request share cache only loads an object's shares once."""
+        obj = TestSharedObjectModel.objects.create()
+        share = obj.shares.create_for_user(created_user=self.user,
+                                           for_user=self.user)
+        request_cache = activate_request_cache()
+
+        try:
+            self.assertEqual(obj.shares.get_for_user(self.user), share)
+            self.assertEqual(list(obj.shares.get_shares_list()), [share])
+            self.assertEqual(request_cache.misses, 1)
+            self.assertEqual(request_cache.hits, 1)
+        finally:
+            deactivate_request_cache()
+
+    def test_request_cache_invalidated_on_create(self):
+        """Test creating a share invalidates the request share cache for the
+        shared object.
+        """
+        obj = TestSharedObjectModel.objects.create()
+        activate_request_cache()
+
+        try:
+            self.assertEqual(len(obj.shares.get_shares_list()), 0)
+            share = obj.shares.create_for_user(created_user=self.user,
+                                               for_user=self.user)
+            self.assertEqual(list(obj.shares.get_shares_list()), [share])
+        finally:
+            deactivate_request_cache()
+
+    def test_get_for_user_prefetched(self):
+        """Test get_for_user doesn't make a query when the shares have already
+        been prefetched.
+        """
+        obj = TestSharedObjectModel.objects.create()
+        share = obj.shares.create_for_user(created_user=self.user,
+                                           for_user=self.user)
+        obj = TestSharedObjectModel.objects.prefetch_related('shares').get(
+            id=obj.id
+        )
+
+        with self.assertNumQueries(0):
+            self.assertEqual(obj.shares.get_for_user(self.user), share)
+
+    def test_prefetch_for_user(self):
+        """Test getting a user's shares for many objects in a single query."""
+        obj_1 = TestSharedObjectModel.objects.create()
+        obj_2 = TestSharedObjectModel2.objects.create()
+        obj_3 = TestSharedObjectModel.objects.create()
+        share_1 = obj_1.shares.create_for_user(created_user=self.user,
+                                               for_user=self.user)
+        share_2 = obj_2.shares.create_for_user(created_user=self.user,
+                                               for_user=self.user)
+
+        with self.assertNumQueries(1):
+            shares = Share.objects.prefetch_for_user(
+                user=self.user,
+                objs=[obj_1, obj_2, obj_3]
+            )
+
+        self.assertEqual(len(shares), 2)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(obj_1.shares.get_for_user(self.user), share_1)
+            self.assertEqual(obj_2.shares.get_for_user(self.user), share_2)
+            self.assertIsNone(obj_3.shares.get_for_user(self.user))
+
+    def test_get_for_user_by_shared_objects(self):
+        """Test getting a user's shares keyed by shared object for objects of
+        different types.
+        """
+        obj_1 = TestSharedObjectModel.objects.create()
+        obj_2 = TestSharedObjectModel2.objects.create()
+        obj_3 = TestSharedObjectModel.objects.create()
+        share_1 = obj_1.shares.create_for_user(created_user=self.user,
+                                               for_user=self.user)
+        share_2 = obj_2.shares.create_for_user(created_user=self.user,
+                                               for_user=self.user)
+        obj_3.shares.create_for_user(created_user=self.user,
+                                     for_user=self.shared_user)
+
+        shares_by_key = Share.objects.get_for_user_by_shared_objects(
+            user=self.user,
+            objs=[obj_1, obj_2, obj_3]
+        )
+
+        self.assertEqual(shares_by_key, {
+            (share_1.content_type_id, obj_1.id): share_1,
+            (share_2.content_type_id, obj_2.id): share_2,
+        })
+
+    def test_iter_by_shared_objects(self):
+        """Test iterating over shares for shared objects returns the same
+        shares for each query strategy.
+        """
+        objs = [TestSharedObjectModel.objects.create() for i in range(3)]
+        objs.append(TestSharedObjectModel2.objects.create())
+        shares = [obj.shares.create_for_user(created_user=self.user,
+                                             for_user=self.user)
+                  for obj in objs]
+
+        for strategy, _ in SharedObjectsQueryStrategy.CHOICES:
+            shares_db = list(Share.objects.iter_by_shared_objects(
+                objs=objs,
+                strategy=strategy,
+                chunk_size=2
+            ))
+            self.assertEqual(len(shares_db), len(shares))
+            self.assertEqual(set(shares_db), set(shares))
+
+        shares_db = list(Share.objects.iter_by_shared_objects(
+            objs=objs,
+            for_user=self.shared_user
+        ))
+        self.assertEqual(shares_db, [])
+
+    def test_create_many_ignore_conflicts(self):
+        """Test ``create_many`` relying on the unique constraint to prevent
+        duplicate shares.
+        """
+        user = create_user()
+        obj_1 = TestSharedObjectModel.objects.create()
+        obj_2 = TestSharedObjectModel.objects.create()
+        ShareClass = TestSharedObjectModel.get_share_class()
+
+        ShareClass.objects.create_many(objs=[obj_1],
+                                       for_user=user,
+                                       created_user=user,
+                                       ignore_conflicts=True)
+        self.assertEqual(obj_1.shares.count(), 1)
+
+        ShareClass.objects.create_many(objs=[obj_1, obj_2],
+                                       for_user=user,
+                                       created_user=user,
+                                       ignore_conflicts=True)
+        self.assertEqual(obj_1.shares.count(), 1)
+        self.assertEqual(obj_2.shares.count(), 1)
+
+    def test_create_many_ignore_conflicts_without_constraint(self):
+        """Test ``create_many`` checks for existing shares when the share
+        model doesn't have a unique constraint to rely on.
+        """
+        user = create_user()
+        obj = TestSharedObjectModel.objects.create()
+        Share.objects.create_many(objs=[obj], for_user=user,
+                                  created_user=user)
+        unique_together = Share._meta.unique_together
+        Share._meta.unique_together = ()
+
+        try:
+            self.assertFalse(Share.objects._has_unique_user_constraint())
+
+            # The existing shares are read instead of inserting first.
+            with CaptureQueriesContext(connection) as queries:
+                Share.objects.create_many(objs=[obj],
+                                          for_user=user,
+                                          created_user=user,
+                                          ignore_conflicts=True)
+
+            self.assertFalse([query for query in queries.captured_queries
+                              if query['sql'].startswith('INSERT')])
+        finally:
+            Share._meta.unique_together = unique_together
+
+        self.assertTrue(Share.objects._has_unique_user_constraint())
+        self.assertEqual(obj.shares.count(), 1)
+
+    def test_bulk_create_prevent_duplicate_share(self):
+        """Test ``bulk_create`` from a shared object doesn't create a second
+        share for a user who already has a share to the object.
+        """
+        user = create_user()
+        obj = TestSharedObjectModel.objects.create()
+        obj.shares.create_for_user(created_user=self.user, for_user=user)
+
+        for ignore_conflicts in (False, True):
+            shares = [Share(for_user=user, created_user=self.user),
+                      Share(for_user=self.shared_user, created_user=self.user)]
+            Share.save_prep(shares)
+            obj.shares.bulk_create(shares, ignore_conflicts=ignore_conflicts)
+            self.assertEqual(obj.shares.count(), 2)
+
+    def test_create_in_batches_for_user(self):
+        """Test creating shares for many objects in batches."""
+        user = create_user()
+        objs = [TestSharedObjectModel.objects.create() for i in range(5)]
+        objs[0].shares.create_for_user(created_user=self.user, for_user=user)
+        progress = []
+
+        num_created = Share.objects.create_in_batches(
+            items=iter(objs),
+            for_user=user,
+            created_user=self.user,
+            batch_size=2,
+            progress_callback=lambda *args: progress.append(args)
+        )
+
+        self.assertEqual(num_created, 4)
+        self.assertEqual(progress, [(2, 1), (4, 3), (5, 4)])
+
+        for obj in objs:
+            self.assertEqual(obj.shares.count(), 1)
+
+    def test_create_in_batches_for_users(self):
+        """Test sharing an object with many users in batches."""
+        obj = TestSharedObjectModel.objects.create()
+        users = [create_user() for i in range(3)]
+        obj.shares.create_for_user(created_user=self.user,
+                                   for_user=users[1])
+
+        num_created = Share.objects.create_in_batches(
+            items=(user for user in users),
+            shared_object=obj,
+            created_user=self.user,
+            batch_size=2
+        )
+
+        self.assertEqual(num_created, 2)
+        self.assertEqual(obj.shares.count(), 3)
+
+    def test_create_for_users(self):
+        """Test sharing one object with many users and emails at once."""
+        obj = TestSharedObjectModel.objects.create()
+        user_1 = create_user()
+        user_2 = create_user()
+        existing_share = obj.shares.create_for_user(created_user=self.user,
+                                                    for_user=user_1)
+
+        created, existing = obj.shares.create_for_users(
+            created_user=self.user,
+            for_users=[user_1, user_2, user_2, 'hello@world.com']
+        )
+
+        self.assertEqual(len(created), 2)
+        self.assertEqual(existing, [existing_share])
+        self.assertEqual(obj.shares.count(), 3)
+        self.assertEqual(obj.shares.filter(for_user=user_2).count(), 1)
+        self.assertEqual(obj.shares.filter(email='hello@world.com').count(), 1)
+
+        created, existing = obj.shares.create_for_users(
+            created_user=self.user,
+            for_users=['hello@world.com']
+        )
+        self.assertEqual(created, [])
+        self.assertEqual(len(existing), 1)
+
+    def test_create_for_users_member_email(self):
+        """Test an email of a member the object is shared with doesn't create
+        a second share for the member.
+        """
+        obj = TestSharedObjectModel.objects.create()
+        user_1 = create_user()
+        user_1.email = 'Member@World.com'
+        user_1.save()
+        user_2 = create_user()
+        existing_share = obj.shares.create_for_user(created_user=self.user,
+                                                    for_user=user_1)
+
+        created, existing = obj.shares.create_for_users(
+            created_user=self.user,
+            for_users=['member@world.com', user_2, user_2.email]
+        )
+
+        self.assertEqual([share.for_user for share in created], [user_2])
+        self.assertEqual(existing, [existing_share])
+        self.assertEqual(obj.shares.count(), 2)
+
+    def test_queryset_status_transitions(self):
+        """Test accepting, declining, inactivating and deleting many shares
+        with a single update.
+        """
+        objs = [TestSharedObjectModel.objects.create() for i in range(3)]
+        Share.objects.create_many(objs=objs,
+                                  for_user=self.shared_user,
+                                  created_user=self.user)
+        shares = Share.objects.filter(for_user=self.shared_user)
+        transitions = ((shares.accept, Status.ACCEPTED),
+                       (shares.decline, Status.DECLINED),
+                       (shares.inactivate, Status.INACTIVE),
+                       (shares.delete_safe, Status.DELETED))
+
+        for transition, status in transitions:
+            with self.assertNumQueries(1):
+                num_updated = transition(last_modified_user=self.user)
+
+            self.assertEqual(num_updated, 3)
+            self.assertEqual(shares.filter(status=status).count(), 3)
+
+        num_updated = shares.accept(last_modified_user=self.user,
+                                    batch_size=2)
+        self.assertEqual(num_updated, 3)
+        self.assertEqual(shares.filter(status=Status.ACCEPTED).count(), 3)
+        self.assertTrue(all(share.response_dttm for share in shares))
+
+    def test_accept_share_only_writes_changed_fields(self):
+        """Test accepting a share doesn't overwrite fields that weren't
+        changed.
+        """
+        share = Share.objects.create_for_user(created_user=self.user,
+                                              for_user=self.user,
+                                              shared_object=self.shared_user,
+                                              message='Hello')
+        Share.objects.filter(id=share.id).update(message='Updated')
+
+        self.assertTrue(share.accept())
+        share_db = Share.objects.get(id=share.id)
+        self.assertEqual(share_db.status, Status.ACCEPTED)
+        self.assertIsNotNone(share_db.response_dttm)
+        self.assertEqual(share_db.message, 'Updated')
+
+    def test_accept_share_expected_status(self):
+        """Test accepting a share with compare and swap on the status."""
+        share = Share.objects.create_for_user(created_user=self.user,
+                                              for_user=self.user,
+                                              shared_object=self.shared_user)
+        stale_share = Share.objects.get(id=share.id)
+
+        self.assertTrue(share.decline(expected_status=Status.PENDING))
+        self.assertFalse(stale_share.accept(expected_status=Status.PENDING))
+        self.assertEqual(stale_share.status, Status.PENDING)
+        self.assertEqual(Share.objects.get(id=share.id).status,
+                         Status.DECLINED)
+
+    def test_accept_share_sends_save_signals(self):
+        """Test accepting a share sends the save signals."""
+        share = Share.objects.create_for_user(created_user=self.user,
+                                              for_user=self.user,
+                                              shared_object=self.shared_user)
+        saved = []
+
+        def receiver(sender, instance, **kwargs):
+            saved.append((instance.id, kwargs['update_fields']))
+
+        post_save.connect(receiver, sender=Share)
+
+        try:
+            self.assertTrue(share.accept())
+        finally:
+            post_save.disconnect(receiver, sender=Share)
+
+        self.assertEqual(len(saved), 1)
+        self.assertEqual(saved[0][0], share.id)
+        self.assertIn('status', saved[0][1])
+
+    def test_get_status_counts(self):
+        """Test getting the number of shares by status for an object."""
+        obj = TestSharedObjectModel.objects.create()
+        obj.shares.create_for_users(created_user=self.user,
+                                    for_users=[self.user, self.shared_user])
+        obj.shares.get_for_user(self.user).accept()
+
+        counts = obj.shares.get_status_counts()
+        self.assertEqual(counts[Status.ACCEPTED], 1)
+        self.assertEqual(counts[Status.PENDING], 1)
+        self.assertEqual(counts[Status.DECLINED], 0)
+
+    def test_shared_cache(self):
+        """Test shares are cached across requests and the cache is
+        invalidated when the shares change.
+        """
+        obj = TestSharedObjectModel.objects.create()
+        share = obj.shares.create_for_user(created_user=self.user,
+                                           for_user=self.user)
+
+        with self.settings(SHARES_CACHE_ALIAS='default'):
+            get_share_cache().invalidate()
+            self.assertEqual(list(obj.shares.get_shares_list()), [share])
+            self.assertEqual(obj.shares.get_for_user(self.user), share)
+
+            # The share users aren't cached so they're loaded in 1 query.
+            with self.assertNumQueries(1):
+                shares = obj.shares.get_shares_list()
+                self.assertEqual(list(shares), [share])
+                self.assertEqual(shares[0].for_user, self.user)
+                self.assertEqual(shares[0].created_user, self.user)
+                self.assertEqual(obj.shares.get_for_user(self.user), share)
+
+            share.accept()
+            self.assertEqual(obj.shares.get_shares_list()[0].status,
+                             Status.ACCEPTED)
+            self.assertEqual(obj.shares.get_for_user(self.user).status,
+                             Status.ACCEPTED)
+
+            Share.objects.filter(id=share.id).decline()
+            self.assertEqual(obj.shares.get_shares_list()[0].status,
+                             Status.DECLINED)
+
+            share_2 = obj.shares.create_for_user(created_user=self.user,
+                                                 for_user=self.shared_user)
+            self.assertEqual(obj.shares.get_for_user(self.shared_user),
+                             share_2)
+            self.assertEqual(len(obj.shares.get_shares_list()), 2)
+
+    def test_share_signals_scoped(self):
+        """Test the share signal receivers are only connected to the share
+        models so other models keep fast deletes.
+        """
+        self.assertTrue(post_save.has_listeners(Share))
+        self.assertFalse(post_save.has_listeners(TestSharedObjectModel))
+        self.assertFalse(post_delete.has_listeners(TestSharedObjectModel))
+
+    def test_get_for_token_cached(self):
+        """Test shares looked up by token are cached and invalidated when the
+        share changes.
+        """
+        obj = TestSharedObjectModel.objects.create()
+        share = obj.shares.create_for_user(created_user=self.user,
+                                           for_user=self.user)
+
+        with self.settings(SHARES_CACHE_ALIAS='default'):
+            get_share_cache().invalidate()
+            self.assertEqual(Share.objects.get_for_token(share.token), share)
+
+            # Users aren't stored in the cache so they're loaded in 1 query.
+            with self.assertNumQueries(1):
+                cached = Share.objects.get_for_token(share.token)
+                self.assertEqual(cached, share)
+                self.assertEqual(cached.for_user, self.user)
+
+            share.accept()
+            self.assertEqual(Share.objects.get_for_token(share.token).status,
+                             Status.ACCEPTED)
+
+            share.delete()
+            self.assertIsNone(Share.objects.get_for_token(share.token))
+
+    def test_has_access(self):
+        """Test checking if a user has a share to a shared object."""
+        obj = TestSharedObjectModel.objects.create()
+        share = obj.shares.create_for_user(created_user=self.user,
+                                           for_user=self.user)
+        content_type_id = share.content_type_id
+
+        self.assertTrue(Share.objects.has_access(
+            user=self.user,
+            content_type_id=content_type_id,
+            object_id=obj.id
+        ))
+        self.assertFalse(Share.objects.has_access(
+            user=self.shared_user,
+            content_type_id=content_type_id,
+            object_id=obj.id
+        ))
+        self.assertFalse(Share.objects.has_access(
+            user=self.user,
+            content_type_id=content_type_id,
+            object_id=obj.id,
+            statuses=[Status.ACCEPTED]
+        ))
+
+        share.accept()
+
+        with self.settings(SHARES_CACHE_ALIAS='default'):
+            self.assertTrue(Share.objects.has_access(
+                user=self.user,
+                content_type_id=content_type_id,
+                object_id=obj.id,
+                statuses=[Status.ACCEPTED]
+            ))
+
+    def test_get_accessible_object_ids(self):
+        """Test getting the ids of all objects shared with a user."""
+        obj_1 = TestSharedObjectModel.objects.create()
+        obj_2 = TestSharedObjectModel.objects.create()
+        obj_3 = TestSharedObjectModel2.objects.create()
+        TestSharedObjectModel.objects.create()
+        share_1 = obj_1.shares.create_for_user(created_user=self.user,
+                                               for_user=self.user)
+        share_3 = obj_3.shares.create_for_user(created_user=self.user,
+                                               for_user=self.user)
+        obj_2.shares.create_for_user(created_user=self.user,
+                                     for_user=self.user,
+                                     status=Status.ACCEPTED)
+
+        object_ids = Share.objects.get_accessible_object_ids(user=self.user)
+        self.assertEqual(list(object_ids[share_1.content_type_id]),
+                         [obj_1.id, obj_2.id])
+        self.assertEqual(list(object_ids[share_3.content_type_id]),
+                         [obj_3.id])
+
+        object_ids = Share.objects.get_accessible_object_ids(
+            user=self.user,
+            statuses=[Status.ACCEPTED]
+        )
+        self.assertEqual(list(object_ids[share_1.content_type_id]),
+                         [obj_2.id])
+        self.assertFalse(share_3.content_type_id in object_ids)
+
+    def test_get_accessible_object_ids_no_join(self):
+        """Test the object ids are read from the share table alone."""
+        with CaptureQueriesContext(connection) as queries:
+            Share.objects.get_accessible_object_ids(user=self.user,
+                                                    use_cache=False)
+
+        self.assertEqual(len(queries.captured_queries), 1)
+        self.assertNotIn(ContentType._meta.db_table,
+                         queries.captured_queries[0]['sql'])
+
+    def test_get_accessible_object_ids_cached(self):
+        """Test the cached object ids are invalidated when the user's shares
+        change.
+        """
+        obj_1 = TestSharedObjectModel.objects.create()
+        obj_2 = TestSharedObjectModel.objects.create()
+        share = obj_1.shares.create_for_user(created_user=self.user,
+                                             for_user=self.user)
+
+        with self.settings(SHARES_CACHE_ALIAS='default'):
+            get_share_cache().invalidate()
+            Share.objects.get_accessible_object_ids(user=self.user)
+
+            with self.assertNumQueries(0):
+                object_ids = Share.objects.get_accessible_object_ids(
+                    user=self.user
+                )
+
+            self.assertEqual(list(object_ids[share.content_type_id]),
+                             [obj_1.id])
+
+            obj_2.shares.create_for_user(created_user=self.user,
+                                         for_user=self.user)
+            object_ids = Share.objects.get_accessible_object_ids(
+                user=self.user
+            )
+            self.assertEqual(list(object_ids[share.content_type_id]),
+                             [obj_1.id, obj_2.id])
+
+    def test_filter_accessible(self):
+        """Test filtering shared objects to the objects shared with a user."""
+        obj_1 = TestSharedObjectModel.objects.create()
+        TestSharedObjectModel.objects.create()
+        obj_3 = TestSharedObjectModel.objects.create()
+        obj_1.shares.create_for_user(created_user=self.user,
+                                     for_user=self.user)
+        obj_3.shares.create_for_user(created_user=self.user,
+                                     for_user=self.user)
+
+        for subquery_threshold in (500, 1):
+            objs = TestSharedObjectModel.objects.filter_accessible(
+                for_user=self.user,
+                subquery_threshold=subquery_threshold
+            )
+            self.assertEqual(set(objs), set([obj_1, obj_3]))
+
+        objs = TestSharedObjectModel.objects.filter_accessible(
+            for_user=self.shared_user
+        )
+        self.assertEqual(list(objs), [])
+
+    def test_filter_accessible_many(self):
+        """Test filtering to more shared objects than can be bound as query
+        parameters.
+        """
+        objs = [TestSharedObjectModel.objects.create() for i in range(1200)]
+        Share.objects.bulk_create([
+            Share(created_user=self.user,
+                  last_modified_user=self.user,
+                  for_user=self.user,
+                  shared_object=obj)
+            for obj in objs
+        ])
+
+        accessible = TestSharedObjectModel.objects.filter_accessible(
+            for_user=self.user
+        )
+        self.assertEqual(accessible.count(), len(objs))
+
+    def test_shared_object_get_for_user(self):
+        """Test getting the objects shared with a user."""
+        obj_1 = TestSharedObjectModel.objects.create()
+        obj_2 = TestSharedObjectModel.objects.create()
+        TestSharedObjectModel.objects.create()
+        obj_1.shares.create_for_user(created_user=self.user,
+                                     for_user=self.user)
+        obj_1.shares.create_for_user(created_user=self.user,
+                                     for_user=self.shared_user)
+        obj_2.shares.create_for_user(created_user=self.user,
+                                     for_user=self.user,
+                                     status=Status.ACCEPTED)
+
+        objs = TestSharedObjectModel.objects.get_for_user(
+            for_user=self.user,
+            annotate_status=True
+        ).order_by('id')
+        self.assertEqual(list(objs), [obj_1, obj_2])
+        self.assertEqual([obj.user_share_status for obj in objs],
+                         [Status.PENDING, Status.ACCEPTED])
+
+        objs = TestSharedObjectModel.objects.get_for_user(
+            for_user=self.user,
+            status=Status.ACCEPTED
+        )
+        self.assertEqual(list(objs), [obj_2])
+
+    def test_shared_object_get_for_user_nested(self):
+        """Test the objects shared with a user can be used as a subquery."""
+        obj_1 = TestSharedObjectModel.objects.create()
+        TestSharedObjectModel.objects.create()
+        obj_2 = TestSharedObjectModel2.objects.create(id=obj_1.id)
+        obj_1.shares.create_for_user(created_user=self.user,
+                                     for_user=self.user)
+        shared_objs = TestSharedObjectModel.objects.get_for_user(
+            for_user=self.user
+        )
+
+        objs = TestSharedObjectModel.objects.filter(id__in=shared_objs)
+        self.assertEqual(list(objs), [obj_1])
+
+        objs = TestSharedObjectModel2.objects.filter(
+            id__in=shared_objs.values('id')
+        )
+        self.assertEqual(list(objs), [obj_2])
+
+    @skipUnless(connection.vendor == 'sqlite', 'Requires sqlite.')
+    def test_shared_object_get_for_user_uses_index(self):
+        """Test the share subquery for getting the objects shared with a user
+        is an index search on the share table.
+        """
+        queryset = TestSharedObjectModel.objects.get_for_user(
+            for_user=self.user
+        )
+        sql, params = queryset.query.sql_with_params()
+        cursor = connection.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN {0}'.format(sql), params)
+        plan = [' '.join(str(column) for column in row)
+                for row in cursor.fetchall()]
+        share_plan = [row for row in plan if 'user_share' in row]
+
+        self.assertTrue(share_plan, plan)
+        self.assertTrue(all('USING' in row and 'INDEX' in row
+                            for row in share_plan), plan)
+
+    def test_with_user_share(self):
+        """Test annotating the user's share onto shared objects."""
+        obj_1 = TestSharedObjectModel.objects.create()
+        obj_2 = TestSharedObjectModel.objects.create()
+        share = obj_1.shares.create_for_user(created_user=self.user,
+                                             for_user=self.user,
+                                             status=Status.ACCEPTED)
+        obj_2.shares.create_for_user(created_user=self.user,
+                                     for_user=self.shared_user)
+
+        with self.assertNumQueries(1):
+            objs = list(TestSharedObjectModel.objects.with_user_share(
+                user=self.user
+            ).filter(id__in=[obj_1.id, obj_2.id]).order_by('id'))
+
+        self.assertEqual(objs, [obj_1, obj_2])
+        self.assertEqual(objs[0].user_share_status, Status.ACCEPTED)
+        self.assertEqual(objs[0].user_share_id, share.id)
+        self.assertEqual(objs[0].user_share_token, share.token)
+        self.assertIsNone(objs[1].user_share_status)
+        self.assertIsNone(objs[1].user_share_id)
+
+    def test_share_index_report(self):
+        """Test the index report for the concrete share models."""
+        out = StringIO()
+        call_command('share_index_report', stdout=out)
+        report = out.getvalue()
+
+        self.assertIn('Share ({0}):'.format(Share._meta.db_table), report)
+        self.assertNotIn('Missing index on (email)', report)
+        self.assertIn('missing index(es) found.', report)
+
+    def test_share_index_report_without_constraints(self):
+        """Test the index report falls back to single column indexes when the
+        database introspection can't get constraints (django < 1.7).
+        """
+        class Introspection(object):
+            get_indexes = connection.introspection.get_indexes
+
+        class Connection(object):
+            introspection = Introspection()
+            cursor = connection.cursor
+
+        command = share_index_report.Command()
+        columns = command.get_indexed_columns(Connection(),
+                                              Share._meta.db_table)
+        self.assertIn((Share._meta.get_field('token').column,), columns)
+
+    def test_content_type_registry(self):
+        """Test content type ids are resolved once and read from memory."""
+        clear_content_type_ids()
+        ContentType.objects.clear_cache()
+        obj = TestSharedObjectModel.objects.create()
+        content_type = ContentType.objects.get_for_model(obj)
+        ContentType.objects.clear_cache()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(get_content_type_id(obj), content_type.id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_content_type_id(TestSharedObjectModel),
+                             content_type.id)
+            self.assertEqual(get_content_type_ids([TestSharedObjectModel]),
+                             {TestSharedObjectModel: content_type.id})
+
+    def test_share_model_registry(self):
+        """Test shared object models are mapped to their share model and
+        back.
+        """
+        self.assertIs(TestSharedObjectModel.get_share_class(), Share)
+        self.assertIs(TestSharedObjectModel.__dict__['_share_class'], Share)
+        self.assertIs(get_share_model(TestSharedObjectModel2), Share)
+
+        shared_object_models = get_shared_object_models(Share)
+        self.assertIn(TestSharedObjectModel, shared_object_models)
+        self.assertIn(TestSharedObjectModel2, shared_object_models)
+
+    def test_get_sharing_for_user(self):
+        """Test getting the shares by status and the user's share with a
+        single query.
+        """
+        obj = TestSharedObjectModel.objects.create()
+        share = obj.shares.create_for_user(created_user=self.user,
+                                           for_user=self.user,
+                                           status=Status.ACCEPTED)
+        obj.shares.create_for_user(created_user=self.user,
+                                   for_user=self.shared_user)
+
+        with self.assertNumQueries(1):
+            shares, shares_by_status, user_share = (
+                obj.shares.get_sharing_for_user(self.user)
+            )
+            self.assertEqual(len(shares), 2)
+            self.assertEqual(list(shares_by_status[Status.ACCEPTED]), [share])
+            self.assertEqual(len(shares_by_status[Status.PENDING]), 1)
+            self.assertEqual(user_share, share)
+
+    def test_keyset_page(self):
+        """Test paginating a user's shares with keyset pagination."""
+        objs = [TestSharedObjectModel.objects.create() for i in range(5)]
+        shares = [obj.shares.create_for_user(created_user=self.user,
+                                             for_user=self.shared_user)
+                  for obj in objs]
+        queryset = Share.objects.get_for_user(self.shared_user)
+
+        page = queryset.keyset_page(page_size=2)
+        self.assertEqual(list(page), shares[::-1][:2])
+        self.assertTrue(page.has_next())
+
+        page = queryset.keyset_page(cursor=page.next_cursor, page_size=2)
+        self.assertEqual(list(page), shares[::-1][2:4])
+
+        page = queryset.keyset_page(cursor=page.next_cursor, page_size=2)
+        self.assertEqual(list(page), shares[::-1][4:])
+        self.assertFalse(page.has_next())
+        self.assertIsNone(page.next_cursor)
+
+    def test_keyset_page_last_sent(self):
+        """Test paginating shares by last sent with ties broken by id."""
+        last_sent = datetime(2014, 1, 1)
+        objs = [TestSharedObjectModel.objects.create() for i in range(3)]
+        shares = [obj.shares.create_for_user(created_user=self.user,
+                                             for_user=self.shared_user,
+                                             last_sent=last_sent)
+                  for obj in objs]
+        queryset = Share.objects.get_for_user(self.shared_user)
+
+        page = queryset.keyset_page(page_size=2, ordering='last_sent')
+        self.assertEqual(list(page), shares[:2])
+
+        page = queryset.keyset_page(cursor=page.next_cursor, page_size=2,
+                                    ordering='last_sent')
+        self.assertEqual(list(page), shares[2:])
+
+    def test_keyset_page_invalid_cursor(self):
+        """Test a tampered cursor or a cursor for a different ordering is
+        rejected.
+        """
+        for obj in [TestSharedObjectModel.objects.create() for i in range(2)]:
+            obj.shares.create_for_user(created_user=self.user,
+                                       for_user=self.shared_user)
+
+        queryset = Share.objects.get_for_user(self.shared_user)
+        cursor = queryset.keyset_page(page_size=1).next_cursor
+        self.assertRaises(ValueError, queryset.keyset_page,
+                          cursor=cursor + 'x')
+        self.assertRaises(ValueError, queryset.keyset_page, cursor=cursor,
+                          ordering='last_sent')
+
+
+class ShareCounterTests(TransactionTestCase):
+    """The cache counter is updated when the shares are committed so these
+    tests run outside of a test transaction.
+    """
+    cache_backend = 'django_shares.counters.CacheShareCounter'
+    model_backend = 'django_shares.counters.ModelShareCounter'
+    count_model = 'test_models.TestShareCount'
+
+    def setUp(self):
+        """Run once per test."""
+        super(ShareCounterTests, self).setUp()
+        self.user = create_user()
+        self.shared_user = create_user()
+
+    def test_get_status_counts_with_counter(self):
+        """Test the share counter is kept up to date by share creation and
+        status changes.
+        """
+        obj = TestSharedObjectModel.objects.create()
+
+        with self.settings(SHARES_COUNTER_BACKEND=self.cache_backend):
+            get_share_counter().clear()
+            self.assertEqual(obj.shares.get_status_counts()[Status.PENDING],
+                             0)
+            obj.shares.create_for_users(
+                created_user=self.user,
+                for_users=[self.user, self.shared_user]
+            )
+            obj.shares.get_for_user(self.user).accept()
+            obj.shares.filter(for_user=self.shared_user).decline()
+
+            with self.assertNumQueries(0):
+                counts = obj.shares.get_status_counts()
+
+            self.assertEqual(counts[Status.ACCEPTED], 1)
+            self.assertEqual(counts[Status.DECLINED], 1)
+            self.assertEqual(counts[Status.PENDING], 0)
+
+            obj.shares.all().delete_safe()
+            counts = obj.shares.get_status_counts()
+            self.assertEqual(counts[Status.DELETED], 2)
+
+    def test_stale_share_status_counts(self):
+        """Test the share counts use the status in the database instead of
+        the status of a stale share.
+        """
+        obj = TestSharedObjectModel.objects.create()
+
+        with self.settings(SHARES_COUNTER_BACKEND=self.cache_backend):
+            get_share_counter().clear()
+            obj.shares.get_status_counts()
+            share = obj.shares.create_for_user(created_user=self.user,
+                                               for_user=self.user)
+            stale_share = Share.objects.get(id=share.id)
+            share.decline()
+            stale_share.accept()
+
+            counts = obj.shares.get_status_counts()
+            self.assertEqual(counts[Status.ACCEPTED], 1)
+            self.assertEqual(counts[Status.DECLINED], 0)
+            self.assertEqual(counts[Status.PENDING], 0)
+
+    def test_counts_rolled_back(self):
+        """Test the cache counts aren't changed by rolled back shares."""
+        obj = TestSharedObjectModel.objects.create()
+
+        with self.settings(SHARES_COUNTER_BACKEND=self.cache_backend):
+            get_share_counter().clear()
+            self.assertEqual(obj.shares.get_status_counts()[Status.PENDING],
+                             0)
+
+            try:
+                with transaction.atomic():
+                    obj.shares.create_for_user(created_user=self.user,
+                                               for_user=self.user)
+                    raise ValueError
+            except ValueError:
+                pass
+
+            self.assertEqual(obj.shares.get_status_counts()[Status.PENDING],
+                             0)
+
+    def test_counts_hard_delete(self):
+        """Test hard deleted shares are removed from the counts."""
+        obj = TestSharedObjectModel.objects.create()
+
+        for backend in (self.cache_backend, self.model_backend):
+            with self.settings(SHARES_COUNTER_BACKEND=backend,
+                               SHARES_COUNTER_MODEL=self.count_model):
+                get_share_counter().clear()
+                obj.shares.get_status_counts()
+                share = obj.shares.create_for_user(created_user=self.user,
+                                                   for_user=self.user)
+                self.assertEqual(
+                    obj.shares.get_status_counts()[Status.PENDING], 1
+                )
+
+                share.delete()
+                self.assertEqual(
+                    obj.shares.get_status_counts()[Status.PENDING], 0
+                )
+
+    def test_cache_counts_concurrent_change(self):
+        """Test a change while the cache counts are being recomputed isn't
+        lost.
+        """
+        obj = TestSharedObjectModel.objects.create()
+
+        with self.settings(SHARES_COUNTER_BACKEND=self.cache_backend):
+            counter = get_share_counter()
+            counter.clear()
+            key = (get_content_type_id(obj), obj.id)
+
+            def load():
+                # A share is created after the counts are read from the
+                # database but before they're cached.
+                counter.incr(key=key, status=Status.PENDING, delta=1)
+                return {Status.PENDING: 0}
+
+            counts = counter.get_counts(key=key, loader=load)
+            self.assertEqual(counts[Status.PENDING], 0)
+            self.assertIsNone(counter.get_counts(key=key))
+
+    def test_model_counts_not_negative(self):
+        """Test a missing model count isn't decremented below 0."""
+        obj = TestSharedObjectModel.objects.create()
+
+        with self.settings(SHARES_COUNTER_BACKEND=self.model_backend,
+                           SHARES_COUNTER_MODEL=self.count_model):
+            counter = get_share_counter()
+            counter.clear()
+            key = (get_content_type_id(obj), obj.id)
+            counter.incr(key=key, status=Status.PENDING, delta=-1)
+            self.assertEqual(counter.get_counts(key)[Status.PENDING], 0)
+
+            counter.incr(key=key, status=Status.PENDING, delta=2)
+            counter.incr(key=key, status=Status.PENDING, delta=-3)
+            self.assertEqual(counter.get_counts(key)[Status.PENDING], 0)
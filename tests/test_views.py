@@ -0,0 +1,370 @@
+from __future__ import unicode_literals
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
+from django.http import HttpResponse
+from django.test.client import RequestFactory
+from django.views.generic import ListView
+from django.views.generic import View
+from django_shares.cache import activate_request_cache
+from django_shares.cache import deactivate_request_cache
+from django_shares.constants import Status
+from django_shares.models import Share
+from django_shares.views import ShareKeysetPaginationViewMixin
+from django_shares.views import ShareRequiredViewMixin
+from django_shares.views import SharedObjectSharesViewMixin
+from django_shares.views import SharedObjectUrlShareViewMixin
+from django_shares.views import SharedObjectViewMixin
+from django_testing.testcases.users import SingleUserTestCase
+from django_testing.user_utils import create_user
+
+from test_models.models import TestSharedObjectModel
+
+
+class SharesView(SharedObjectSharesViewMixin, SharedObjectViewMixin, View):
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse()
+
+
+class ShareRequiredView(ShareRequiredViewMixin, SharedObjectSharesViewMixin,
+                        SharedObjectViewMixin, View):
+    shared_object_model = TestSharedObjectModel
+    shared_object_pk_url_kwarg = 'pk'
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse()
+
+    def get_object(self):
+        return TestSharedObjectModel.objects.get(id=self.kwargs['pk'])
+
+
+class ShareRequiredObjectIdView(ShareRequiredView):
+    shared_object_pk_url_kwarg = None
+
+    def get_object(self):
+        return TestSharedObjectModel.objects.get(id=self.kwargs['object_id'])
+
+
+class ShareRequiredParentView(ShareRequiredView):
+    """The shared object is a different object than the one in the url."""
+    shared_object_pk_url_kwarg = None
+
+    def get_shared_object(self):
+        return TestSharedObjectModel.objects.get(id=self.kwargs['parent_id'])
+
+
+class UrlShareView(SharedObjectUrlShareViewMixin, SharedObjectViewMixin,
+                   View):
+    shared_object_model = TestSharedObjectModel
+    shared_object_pk_url_kwarg = 'pk'
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse()
+
+    def get_object(self):
+        return TestSharedObjectModel.objects.get(id=self.kwargs['pk'])
+
+
+class UrlShareParentView(UrlShareView):
+    """The shared object is a different object than the one in the url."""
+    shared_object_pk_url_kwarg = None
+
+    def get_shared_object(self):
+        return TestSharedObjectModel.objects.get(id=self.kwargs['parent_id'])
+
+
+class ShareListView(ShareKeysetPaginationViewMixin, ListView):
+    paginate_by = 2
+
+    def get_queryset(self):
+        return Share.objects.get_for_user(self.request.user)
+
+
+class SharedObjectSharesViewMixinTests(SingleUserTestCase):
+
+    def setUp(self):
+        """Run once per test."""
+        super(SharedObjectSharesViewMixinTests, self).setUp()
+        self.obj = TestSharedObjectModel.objects.create()
+        self.obj.shares.create_for_users(
+            created_user=self.user,
+            for_users=[self.user, create_user(), create_user()]
+        )
+        self.obj.shares.get_for_user(self.user).accept()
+
+    def get_view(self, user=None, **initkwargs):
+        """Gets the view after dispatching a GET request to it."""
+        request = RequestFactory().get('/')
+        request.user = user or AnonymousUser()
+        view = SharesView(shared_object=self.obj, **initkwargs)
+        view.request = request
+        view.args = ()
+        view.kwargs = {}
+        view.dispatch(request)
+        return view
+
+    def test_shares_by_status(self):
+        """Test the shares for the shared object are set by status."""
+        view = self.get_view(user=self.user)
+        self.assertEqual(len(view.shared_object_shares_accepted), 1)
+        self.assertEqual(len(view.shared_object_shares_pending), 2)
+        self.assertEqual(view.shared_object_user_share.for_user, self.user)
+
+    def test_shares_single_query(self):
+        """Test the shares and the user's share are loaded with a single
+        query and the shares are bound to the shared object.
+        """
+        with self.assertNumQueries(1):
+            view = self.get_view(user=self.user)
+
+            for share in view.shared_object_shares:
+                self.assertEqual(share.shared_object, self.obj)
+                self.assertTrue(share.for_user.email)
+                self.assertTrue(share.created_user.email)
+
+    def test_user_share_lazy(self):
+        """Test the user's share is read from the shares for the shared
+        object when it's first accessed.
+        """
+        with self.assertNumQueries(0):
+            view = self.get_view(user=self.user)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(view.shared_object_user_share.for_user,
+                             self.user)
+            self.assertEqual(len(view.shared_object_shares), 3)
+
+    def test_shares_lazy(self):
+        """Test the shares aren't loaded until they're accessed and all the
+        lists share a single fetch.
+        """
+        with self.assertNumQueries(0):
+            view = self.get_view()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(len(view.shared_object_shares_accepted), 1)
+            self.assertEqual(len(view.shared_object_shares_pending), 2)
+            self.assertFalse(view.shared_object_shares_declined)
+
+    def test_eager_shares(self):
+        """Test all the shares are loaded in dispatch with a single query and
+        nothing queries afterwards when ``eager_shares`` is True.
+        """
+        with self.assertNumQueries(1):
+            view = self.get_view(user=self.user, eager_shares=True)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(len(view.shared_object_shares), 3)
+            self.assertEqual(len(view.shared_object_shares_accepted), 1)
+            self.assertEqual(len(view.shared_object_shares_pending), 2)
+            self.assertFalse(view.shared_object_shares_declined)
+            self.assertEqual(view.shared_object_user_share.for_user,
+                             self.user)
+
+    def test_aggregate_shares(self):
+        """Test only the share counts are loaded up front when
+        ``aggregate_shares`` is True.
+        """
+        with self.assertNumQueries(1):
+            view = self.get_view(aggregate_shares=True)
+            self.assertEqual(view.shared_object_share_counts[Status.PENDING],
+                             2)
+            self.assertEqual(len(view.shared_object_shares_accepted), 1)
+            self.assertEqual(len(view.shared_object_shares_pending), 2)
+            self.assertFalse(view.shared_object_shares_declined)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(len(view.shared_object_shares_pending[:1]), 1)
+
+    def test_aggregate_shares_user_share(self):
+        """Test the user's share is queried on its own instead of loading all
+        the shares when ``aggregate_shares`` is True and the request share
+        cache is active.
+        """
+        request_cache = activate_request_cache()
+
+        try:
+            # 1 query for the share counts and 1 for the user's share.
+            with self.assertNumQueries(2):
+                view = self.get_view(user=self.user, aggregate_shares=True)
+                self.assertEqual(view.shared_object_user_share.for_user_id,
+                                 self.user.id)
+
+            self.assertEqual(request_cache.get_stats()['objects'], 0)
+        finally:
+            deactivate_request_cache()
+
+
+class ShareRequiredViewMixinTests(SingleUserTestCase):
+
+    def setUp(self):
+        """Run once per test."""
+        super(ShareRequiredViewMixinTests, self).setUp()
+        self.obj = TestSharedObjectModel.objects.create()
+        self.obj.shares.create_for_user(created_user=self.user,
+                                        for_user=self.user)
+
+    def dispatch(self, user):
+        request = RequestFactory().get('/')
+        request.user = user
+        return ShareRequiredView.as_view()(request, pk=self.obj.id)
+
+    def test_share_required(self):
+        """Test a user with a share has access to the shared object."""
+        response = self.dispatch(user=self.user)
+        self.assertEqual(response.status_code, 200)
+
+    def test_share_required_denied(self):
+        """Test a user without a share is denied before the shared object is
+        fetched.
+        """
+        user = create_user()
+
+        with self.assertNumQueries(1):
+            self.assertRaises(PermissionDenied, self.dispatch, user=user)
+
+    def test_share_required_without_url_key(self):
+        """Test access is checked against the fetched shared object when the
+        shared object can't be identified from the url.
+        """
+        request = RequestFactory().get('/')
+        request.user = self.user
+        response = ShareRequiredObjectIdView.as_view()(request,
+                                                   object_id=self.obj.id)
+        self.assertEqual(response.status_code, 200)
+
+        request.user = create_user()
+        self.assertRaises(PermissionDenied, ShareRequiredObjectIdView.as_view(),
+                          request, object_id=self.obj.id)
+
+    def test_share_required_overridden_shared_object(self):
+        """Test access is checked against the object from
+        ``get_shared_object`` instead of the object in the url when the url
+        kwarg isn't set explicitly.
+        """
+        obj_2 = TestSharedObjectModel.objects.create()
+        request = RequestFactory().get('/')
+        request.user = self.user
+        response = ShareRequiredParentView.as_view()(request, pk=obj_2.id,
+                                                     parent_id=self.obj.id)
+        self.assertEqual(response.status_code, 200)
+
+        self.assertRaises(PermissionDenied, ShareRequiredParentView.as_view(),
+                          request, pk=self.obj.id, parent_id=obj_2.id)
+
+
+class SharedObjectUrlShareViewMixinTests(SingleUserTestCase):
+
+    def setUp(self):
+        """Run once per test."""
+        super(SharedObjectUrlShareViewMixinTests, self).setUp()
+        self.obj = TestSharedObjectModel.objects.create()
+        self.share = self.obj.shares.create_for_user(created_user=self.user,
+                                                     for_user=self.user)
+
+    def get_url_share(self, pk, token):
+        """Gets the url share for the view without dispatching to it."""
+        request = RequestFactory().get('/')
+        request.user = self.user
+        view = UrlShareView()
+        view.request = request
+        view.args = ()
+        view.kwargs = {'pk': pk, 'token': token}
+        return view.get_url_share(**view.kwargs)
+
+    def test_url_share_by_token(self):
+        """Test the url share is resolved by token in a single query without
+        fetching the shared object.
+        """
+        with self.assertNumQueries(1):
+            url_share = self.get_url_share(pk=self.obj.id,
+                                           token=self.share.token)
+            self.assertEqual(url_share, self.share)
+            self.assertEqual(url_share.for_user, self.user)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(url_share.shared_object, self.obj)
+
+    def test_url_share_dispatch(self):
+        """Test the url share and the shared object are set on dispatch."""
+        request = RequestFactory().get('/')
+        request.user = self.user
+        response = UrlShareView.as_view()(request, pk=self.obj.id,
+                                          token=self.share.token)
+        self.assertEqual(response.status_code, 200)
+
+    def test_url_share_wrong_shared_object(self):
+        """Test a token for a different shared object raises a 404."""
+        obj_2 = TestSharedObjectModel.objects.create()
+        self.assertRaises(Http404, self.get_url_share, pk=obj_2.id,
+                          token=self.share.token)
+
+    def test_url_share_overridden_shared_object(self):
+        """Test the share is checked against the object from
+        ``get_shared_object`` instead of the object in the url when the url
+        kwarg isn't set explicitly.
+        """
+        obj_2 = TestSharedObjectModel.objects.create()
+        request = RequestFactory().get('/')
+        request.user = self.user
+        view = UrlShareParentView()
+        view.request = request
+        view.args = ()
+        view.kwargs = {'pk': obj_2.id, 'parent_id': self.obj.id,
+                       'token': self.share.token}
+        self.assertEqual(view.get_url_share(**view.kwargs), self.share)
+
+        view = UrlShareParentView()
+        view.request = request
+        view.args = ()
+        view.kwargs = {'pk': self.obj.id, 'parent_id': obj_2.id,
+                       'token': self.share.token}
+        self.assertRaises(Http404, view.get_url_share, **view.kwargs)
+
+    def test_url_share_bad_token(self):
+        """Test an unknown token raises a 404."""
+        self.assertRaises(Http404, self.get_url_share, pk=self.obj.id,
+                          token='not-a-token')
+
+
+class ShareKeysetPaginationViewMixinTests(SingleUserTestCase):
+
+    def setUp(self):
+        """Run once per test."""
+        super(ShareKeysetPaginationViewMixinTests, self).setUp()
+        self.shares = [
+            TestSharedObjectModel.objects.create().shares.create_for_user(
+                created_user=self.user,
+                for_user=self.user
+            )
+            for i in range(3)
+        ]
+
+    def get_context_data(self, cursor=None):
+        """Gets the context data for a page of the list view."""
+        request = RequestFactory().get('/', {'cursor': cursor} if cursor
+                                       else {})
+        request.user = self.user
+        view = ShareListView()
+        view.request = request
+        view.args = ()
+        view.kwargs = {}
+        view.object_list = view.get_queryset()
+        return view.get_context_data()
+
+    def test_keyset_pagination(self):
+        """Test paging through the shares with the next cursor."""
+        context = self.get_context_data()
+        self.assertEqual(list(context['object_list']), self.shares[::-1][:2])
+        self.assertTrue(context['is_paginated'])
+        self.assertTrue(context['next_cursor'])
+
+        context = self.get_context_data(cursor=context['next_cursor'])
+        self.assertEqual(list(context['object_list']), self.shares[::-1][2:])
+        self.assertIsNone(context['next_cursor'])
+
+    def test_keyset_pagination_invalid_cursor(self):
+        """Test an invalid cursor raises a 404."""
+        self.assertRaises(Http404, self.get_context_data, cursor='bad')